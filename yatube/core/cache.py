@@ -0,0 +1,306 @@
+"""
+Общий для процессов кэш в файле SQLite.
+
+LocMemCache живёт в памяти одного процесса: у каждого воркера свои
+фрагменты и версии ключей, и сброс версии в одном процессе не виден
+остальным. SQLiteCache хранит записи в одном файле в режиме WAL, поэтому
+его видят все процессы на машине, а чтения не блокируются записью.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+                'MAX_SIZE': 256 * 1024 * 1024,
+            },
+        },
+    }
+
+Истёкшие записи не возвращаются и удаляются при очистке (cull), которая
+запускается раз в CULL_EVERY изменений. Когда записей больше MAX_ENTRIES
+или их объём больше MAX_SIZE байт, удаляются давно не читавшиеся (LRU):
+время чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд, чтобы
+чтения горячих ключей не превращались в записи. Целые числа хранятся
+как есть, поэтому incr — одно обновление строки в транзакции; остальные
+значения сериализуются pickle.
+"""
+import contextlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+# Ограничение SQLite на число параметров в одном запросе.
+MAX_PARAMS = 900
+INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def _dump(value):
+    # bool — тоже int, но после чтения должен остаться bool.
+    if type(value) is int and value in INT_RANGE:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _load(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+def _size(value):
+    return len(value) if isinstance(value, bytes) else 8
+
+
+def _chunks(items, size=MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_size = options.get('MAX_SIZE')
+        self.access_resolution = options.get('ACCESS_RESOLUTION', 1)
+        self.cull_every = options.get('CULL_EVERY', 100)
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5000)
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        """Соединение текущего потока; после fork открывается заново."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout / 1000,
+                isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @contextlib.contextmanager
+    def _write(self):
+        """Транзакция с блокировкой на запись с самого начала."""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _keys(self, keys, version):
+        result = {}
+        for key in keys:
+            cache_key = self.make_key(key, version=version)
+            self.validate_key(cache_key)
+            result[cache_key] = key
+        return result
+
+    def _read(self, cache_keys):
+        """Живые значения по ключам; время чтения обновляется."""
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in _chunks(list(cache_keys)):
+            rows = self.connection.execute(
+                f'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                f'AND {ALIVE}',
+                (*chunk, now),
+            )
+            for key, value, accessed in rows:
+                found[key] = _load(value)
+                if accessed < now - self.access_resolution:
+                    stale.append(key)
+        if stale:
+            for chunk in _chunks(stale):
+                self.connection.execute(
+                    f'UPDATE cache SET accessed = ? '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                    (now, *chunk),
+                )
+        return found
+
+    def _store(self, rows, timeout, mode='REPLACE'):
+        """Пишет пары (ключ, значение); возвращает число записанных."""
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        values = []
+        for key, value in rows:
+            value = _dump(value)
+            values.append((key, value, expires, now, _size(value)))
+        with self._write() as connection:
+            if mode == 'IGNORE':
+                # Запись с истёкшим сроком не мешает add.
+                connection.executemany(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    [(row[0], now) for row in values],
+                )
+            cursor = connection.executemany(
+                f'INSERT OR {mode} INTO cache '
+                f'(key, value, expires, accessed, size) '
+                f'VALUES (?, ?, ?, ?, ?)',
+                values,
+            )
+            stored = cursor.rowcount
+        self._writes += len(values)
+        if self._writes >= self.cull_every:
+            self._writes = 0
+            self.cull()
+        return stored
+
+    def cull(self):
+        """Удаляет истёкшие записи и самые давно читавшиеся сверх лимитов."""
+        now = time.time()
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE expires <= ?', (now,))
+            count, size = connection.execute(
+                'SELECT count(*), total(size) FROM cache').fetchone()
+            excess = 0
+            if count > self._max_entries:
+                # Как в Django: удаляется 1/CULL_FREQUENCY записей, чтобы
+                # не чистить кэш при каждой записи.
+                excess = max(count - self._max_entries,
+                             count // max(self._cull_frequency, 1))
+            if excess:
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                    (excess,),
+                )
+            if self.max_size and size > self.max_size:
+                # Удаляются самые старые записи, пока объём не станет
+                # меньше лимита.
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    ' SELECT key FROM ('
+                    '  SELECT key, sum(size) OVER ('
+                    '   ORDER BY accessed DESC, key'
+                    '  ) AS running FROM cache'
+                    ' ) WHERE running > ?'
+                    ')',
+                    (self.max_size,),
+                )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._store([(key, value)], timeout, mode='IGNORE') == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._read([key]).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store([(key, value)], timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as connection:
+            cursor = connection.execute(
+                f'UPDATE cache SET expires = ?, accessed = ? '
+                f'WHERE key = ? AND {ALIVE}',
+                (self.get_backend_timeout(timeout), now, key, now),
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def get_many(self, keys, version=None):
+        keys = self._keys(keys, version)
+        return {
+            keys[cache_key]: value
+            for cache_key, value in self._read(keys).items()
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        keys = self._keys(data, version)
+        self._store(
+            [(cache_key, data[key]) for cache_key, key in keys.items()],
+            timeout,
+        )
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = list(self._keys(keys, version))
+        with self._write() as connection:
+            for chunk in _chunks(keys):
+                connection.execute(
+                    f'DELETE FROM cache '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                    chunk,
+                )
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов: чтение и запись в одной транзакции."""
+        cache_key = self.make_key(key, version=version)
+        self.validate_key(cache_key)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+                (cache_key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = _dump(_load(row[0]) + delta)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?',
+                (value, _size(value), now, cache_key),
+            )
+        return _load(value)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение потока остаётся открытым между запросами.
+        pass
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+# Кэши, которые видят все процессы на машине.
+SHARED = ('filebased', 'sqlite')
+BATCH = 10
+
+
+def create_cache(name, directory):
+    location = {
+        'locmem': 'benchmark',
+        'filebased': os.path.join(directory, 'filebased'),
+        'sqlite': os.path.join(directory, 'cache.sqlite3'),
+    }[name]
+    params = {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+    return import_string(BACKENDS[name])(location, params)
+
+
+def timed(operation, count):
+    start = time.perf_counter()
+    for number in range(count):
+        operation(number)
+    return time.perf_counter() - start
+
+
+def run_operations(cache, count, value):
+    """Время в секундах на count операций каждого вида."""
+    cache.clear()
+    cache.set('counter', 0)
+    batches = max(count // BATCH, 1)
+    return {
+        'set': timed(lambda n: cache.set(f'key:{n}', value), count),
+        'get': timed(lambda n: cache.get(f'key:{n}'), count),
+        'get (промах)': timed(lambda n: cache.get(f'missing:{n}'), count),
+        f'set_many({BATCH})': timed(lambda n: cache.set_many({
+            f'many:{n}:{i}': value for i in range(BATCH)}), batches),
+        f'get_many({BATCH})': timed(lambda n: cache.get_many([
+            f'key:{n * BATCH + i}' for i in range(BATCH)]), batches),
+        'incr': timed(lambda n: cache.incr('counter'), count),
+    }, batches
+
+
+def increment(name, directory, count):
+    cache = create_cache(name, directory)
+    for _ in range(count):
+        cache.incr('shared')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость LocMemCache, FileBasedCache и SQLiteCache '
+        'и проверяет атомарность incr из нескольких процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--operations', type=int, default=5000,
+            help='Сколько операций каждого вида выполнить.',
+        )
+        parser.add_argument(
+            '--value-size', type=int, default=1024,
+            help='Размер значения в байтах.',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=4,
+            help='Сколько процессов одновременно вызывают incr.',
+        )
+        parser.add_argument(
+            '--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+            help='Какие кэши замерить.',
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in options['backends']:
+                self.benchmark(name, directory, options)
+        finally:
+            shutil.rmtree(directory)
+
+    def benchmark(self, name, directory, options):
+        cache = create_cache(name, directory)
+        count = options['operations']
+        timings, batches = run_operations(
+            cache, count, b'x' * options['value_size'])
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for operation, elapsed in timings.items():
+            total = batches if 'many' in operation else count
+            self.stdout.write(
+                f'  {operation:<14} {total / elapsed:>10.0f} в секунду  '
+                f'{elapsed / total * 10 ** 6:>8.1f} мкс'
+            )
+        if name not in SHARED:
+            return
+        cache.set('shared', 0)
+        processes = options['processes']
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=increment, args=(name, directory, count))
+            for _ in range(processes)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        expected = processes * count
+        result = cache.get('shared')
+        self.stdout.write(
+            f'  incr из {processes} процессов: {result} из {expected} '
+            f'({expected / elapsed:.0f} в секунду)'
+        )
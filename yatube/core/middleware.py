@@ -0,0 +1,195 @@
+"""
+Замеры запросов: SQL, шаблоны, кэш и время представления.
+
+Для доли запросов INSTRUMENTATION_SAMPLE_RATE middleware считает число
+SQL-запросов и время в базе, время отрисовки шаблонов, попадания и
+промахи кэша, время представления и всего запроса. Результат уходит
+в заголовок Server-Timing и одной JSON-строкой в лог core.middleware.
+При нулевой доле middleware отключается целиком (MiddlewareNotUsed),
+а для запросов вне выборки стоит один вызов random().
+"""
+import contextlib
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_MISSING = object()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса; время — в секундах."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_time = 0.0
+        self.total_time = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'view_ms': round(self.view_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+        }
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} SQL"',
+            f'tpl;dur={self.template_time * 1000:.2f}',
+            f'cache;desc="hit {self.cache_hits} miss {self.cache_misses}"',
+            f'view;dur={self.view_time * 1000:.2f}',
+            f'total;dur={self.total_time * 1000:.2f}',
+        ))
+
+
+def _timed_render(render):
+    """Замер Template.render; вложенные вызовы не считаются дважды."""
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        metrics = getattr(_state, 'metrics', None)
+        if metrics is None:
+            return render(self, *args, **kwargs)
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+    wrapper.instrumented = True
+    return wrapper
+
+
+def install_template_timing():
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+
+
+@contextlib.contextmanager
+def count_cache_calls(metrics):
+    """
+    Считает попадания и промахи get и get_many кэшей из CACHES.
+
+    Экземпляры кэшей у каждого потока свои, поэтому методы подменяются
+    на время запроса только у экземпляров текущего потока. BaseCache
+    реализует get_many через self.get: такие вызовы уже посчитаны в
+    get_many и второй раз не учитываются.
+    """
+    instances = [caches[alias] for alias in settings.CACHES]
+    in_get_many = False
+
+    def counted_get(get):
+        def wrapper(key, default=None, version=None):
+            if in_get_many:
+                return get(key, default, version=version)
+            value = get(key, _MISSING, version=version)
+            if value is _MISSING:
+                metrics.cache_misses += 1
+                return default
+            metrics.cache_hits += 1
+            return value
+        return wrapper
+
+    def counted_get_many(get_many):
+        def wrapper(keys, version=None):
+            nonlocal in_get_many
+            keys = list(keys)
+            in_get_many = True
+            try:
+                found = get_many(keys, version=version)
+            finally:
+                in_get_many = False
+            metrics.cache_hits += len(found)
+            metrics.cache_misses += len(keys) - len(found)
+            return found
+        return wrapper
+
+    for instance in instances:
+        instance.get = counted_get(instance.get)
+        instance.get_many = counted_get_many(instance.get_many)
+    try:
+        yield
+    finally:
+        for instance in instances:
+            del instance.get
+            del instance.get_many
+
+
+class InstrumentationMiddleware:
+    """
+    Собирает метрики запроса; должна стоять первой в MIDDLEWARE, чтобы
+    учитывать запросы к базе и кэшу из остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(
+            settings, 'INSTRUMENTATION_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_template_timing()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        request._metrics = metrics
+        _state.metrics = metrics
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute_wrapper))
+                stack.enter_context(count_cache_calls(metrics))
+                response = self.get_response(request)
+        finally:
+            _state.metrics = None
+        end = time.perf_counter()
+        metrics.total_time = end - start
+        if hasattr(request, '_view_started'):
+            metrics.view_time = end - request._view_started
+        timing = metrics.server_timing()
+        if response.has_header('Server-Timing'):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response['Server-Timing'] = timing
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_metrics'):
+            request._view_started = time.perf_counter()
@@ -0,0 +1,19 @@
+"""
+Настройка соединений SQLite при открытии.
+
+PRAGMA из settings.SQLITE_PRAGMAS выполняются для каждого нового
+соединения: большинство из них (кроме journal_mode) действует только
+в пределах соединения. Вместе с CONN_MAX_AGE это делается один раз на
+постоянное соединение, а не на каждый запрос.
+"""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: выполняет SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None) or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
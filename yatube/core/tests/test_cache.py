@@ -0,0 +1,133 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_cache(self, **options):
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': options},
+        )
+
+    def test_get_set_delete(self):
+        values = {'int': 5, 'flag': True, 'data': {'a': [1, 2]},
+                  'big': 2 ** 70, 'text': 'строка'}
+        for key, value in values.items():
+            self.cache.set(key, value)
+        for key, value in values.items():
+            self.assertEqual(self.cache.get(key), value)
+            self.assertIs(type(self.cache.get(key)), type(value))
+        self.cache.delete('int')
+        self.assertIsNone(self.cache.get('int'))
+        self.assertEqual(self.cache.get('int', 'нет'), 'нет')
+        self.assertTrue(self.cache.has_key('text'))
+
+    def test_shared_between_instances(self):
+        """Второй экземпляр (как в другом процессе) видит те же записи."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.create_cache().get('key'), 'value')
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+        self.cache.set('expired', 1, timeout=0)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_timeout(self):
+        self.cache.set('key', 'value', timeout=10)
+        self.cache.set('forever', 'value', timeout=None)
+        now = self.cache.get_backend_timeout(0)
+        with mock.patch('time.time', return_value=now + 20):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertFalse(self.cache.has_key('key'))
+            self.assertEqual(self.cache.get('forever'), 'value')
+        self.assertTrue(self.cache.touch('key', timeout=0))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_many(self):
+        self.assertEqual(self.cache.set_many({'a': 1, 'b': [2]}), [])
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        self.cache.delete_many(['a', 'c'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'b': [2]})
+
+    def test_incr(self):
+        self.cache.set('counter', 10)
+        self.assertEqual(self.cache.incr('counter', 5), 15)
+        self.assertEqual(self.cache.decr('counter'), 14)
+        self.assertEqual(self.cache.get('counter'), 14)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_is_atomic(self):
+        """Одновременные incr из разных соединений не теряются."""
+        self.cache.set('counter', 0)
+
+        def increment():
+            cache = self.create_cache()
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_lru_eviction(self):
+        cache = self.create_cache(
+            MAX_ENTRIES=3, CULL_FREQUENCY=3, CULL_EVERY=1,
+            ACCESS_RESOLUTION=0)
+        now = cache.get_backend_timeout(0)
+        for number, key in enumerate('abc'):
+            with mock.patch('time.time', return_value=now + number):
+                cache.set(key, key)
+        with mock.patch('time.time', return_value=now + 3):
+            cache.get('a')
+        with mock.patch('time.time', return_value=now + 4):
+            cache.set('d', 'd')
+        # Дольше всех не читалась запись b.
+        self.assertEqual(
+            cache.get_many(['a', 'b', 'c', 'd']),
+            {'a': 'a', 'c': 'c', 'd': 'd'})
+
+    def test_size_limit(self):
+        cache = self.create_cache(MAX_SIZE=2500, CULL_EVERY=1)
+        for key in 'abcd':
+            cache.set(key, b'x' * 1000)
+        self.assertEqual(set(cache.get_many(['a', 'b', 'c', 'd'])),
+                         {'c', 'd'})
+
+    def test_clear(self):
+        self.cache.set('key', 1)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+
+class BenchmarkCacheTest(SimpleTestCase):
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command('benchmark_cache', operations=20, processes=2,
+                     backends=['locmem', 'sqlite'], stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('locmem', output)
+        self.assertIn('incr из 2 процессов: 40 из 40', output)
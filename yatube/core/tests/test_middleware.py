@@ -0,0 +1,85 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+
+from ..middleware import (InstrumentationMiddleware, RequestMetrics,
+                          count_cache_calls)
+
+User = get_user_model()
+
+
+def parse_timing(header):
+    metrics = {}
+    for metric in header.split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('posts:home'))
+        metrics = parse_timing(response['Server-Timing'])
+        self.assertEqual(
+            set(metrics), {'db', 'tpl', 'cache', 'view', 'total'})
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} SQL"')
+        self.assertGreater(float(metrics['tpl']['dur']), 0)
+        self.assertRegex(metrics['cache']['desc'], r'^"hit \d+ miss \d+"$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('posts:home'))
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreaterEqual(record['total_ms'], record['view_ms'])
+
+    def test_cache_hits_counted(self):
+        """Повторный запрос берёт версии и фрагменты из кэша."""
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get(reverse('posts:home'))
+            self.client.get(reverse('posts:home'))
+        first, second = (
+            json.loads(record.getMessage()) for record in logs.records)
+        # Первый запрос: три версии областей для ETag не найдены и
+        # дочитываются после add, затем ещё раз читаются для фрагмента,
+        # которого тоже нет. Второй: те же шесть версий и фрагмент.
+        self.assertEqual((first['cache_hits'], first['cache_misses']), (6, 4))
+        self.assertEqual(
+            (second['cache_hits'], second['cache_misses']), (7, 0))
+        # После запроса у кэша снова его собственные методы.
+        self.assertNotIn('get', vars(caches['default']))
+
+    def test_get_many_counted_once(self):
+        """Ключи get_many не считаются повторно во внутренних get"""
+        cache.set_many({'a': 1, 'b': 2})
+        metrics = RequestMetrics()
+        with count_cache_calls(metrics):
+            cache.get_many(['a', 'b', 'c'])
+            cache.get('a')
+            cache.get('c')
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (3, 2))
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentationMiddleware(lambda request: HttpResponse())
+        response = self.client.get(reverse('posts:home'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,65 @@
+import importlib
+import os
+import sys
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ..sqlite import configure_connection
+
+
+class ConfigureConnectionTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        previous = self.pragma('cache_size')
+        with override_settings(SQLITE_PRAGMAS={
+                'cache_size': -2048, 'busy_timeout': 1234}):
+            configure_connection(sender=None, connection=connection)
+        try:
+            self.assertEqual(self.pragma('cache_size'), -2048)
+            self.assertEqual(self.pragma('busy_timeout'), 1234)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA cache_size = {previous}')
+                cursor.execute('PRAGMA busy_timeout = 0')
+
+    def test_no_pragmas_by_default(self):
+        previous = self.pragma('cache_size')
+        configure_connection(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), previous)
+
+
+class ProductionSettingsTest(SimpleTestCase):
+    def load(self, **environ):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('DJANGO_SECRET_KEY', None)
+            os.environ.update(environ)
+            sys.modules.pop('yatube.settings_production', None)
+            return importlib.import_module('yatube.settings_production')
+
+    def test_secret_key_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load()
+
+    def test_production_settings(self):
+        production = self.load(DJANGO_SECRET_KEY='production-key')
+        self.assertEqual(production.SECRET_KEY, 'production-key')
+        self.assertFalse(production.DEBUG)
+        self.assertNotIn('debug_toolbar', production.INSTALLED_APPS)
+        self.assertFalse(any(
+            'debug_toolbar' in middleware
+            for middleware in production.MIDDLEWARE))
+        options = production.TEMPLATES[0]['OPTIONS']
+        self.assertEqual(
+            options['loaders'][0][0], 'django.template.loaders.cached.Loader')
+        self.assertIn('core.context_processors.year.year',
+                      options['context_processors'])
+        self.assertGreater(production.CONN_MAX_AGE, 0)
+        self.assertEqual(production.SQLITE_PRAGMAS['journal_mode'], 'WAL')
+        self.assertGreater(production.THUMBNAIL_WORKERS, 0)
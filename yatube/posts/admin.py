@@ -1,6 +1,36 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
 from .models import Group, Post, Comment
+from .search import filter_posts
+from .utils import EstimatedCountPaginator
+
+
+class PrefetchedAutocompleteSelect(AutocompleteSelect):
+    """
+    Автокомплит, который берёт выбранные объекты из instances, если они
+    там есть, а не запрашивает их из базы для каждой строки списка.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances = {}
+
+    def optgroups(self, name, value, attr=None):
+        selected = [
+            str(pk) for pk in value
+            if str(pk) not in self.choices.field.empty_values
+        ]
+        if not all(pk in self.instances for pk in selected):
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for pk in selected:
+            label = self.choices.field.label_from_instance(self.instances[pk])
+            options.append(
+                self.create_option(name, pk, label, True, len(options)))
+        return [(None, options, 0)]
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -12,11 +42,70 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    # Виджеты с поиском вместо <select> со всеми пользователями и
+    # группами в форме поста и в каждой строке списка.
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
+    # Фильтр по дате выбирает диапазон по индексу post_pub_date_idx.
+    # date_hierarchy не используется: список годов он получает через
+    # SELECT DISTINCT по всей таблице при каждом открытии списка.
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту через полнотекстовый индекс вместо LIKE."""
+        if not search_term.strip():
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.list_editable:
+            kwargs.setdefault('widget', PrefetchedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        """
+        Группы строк списка уже загружены через list_select_related:
+        виджеты list_editable берут их оттуда.
+        """
+        formset_class = super().get_changelist_formset(request, **kwargs)
+
+        class FormSet(formset_class):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                widget = self.form.base_fields['group'].widget.widget
+                widget.instances.update(
+                    (str(post.group_id), post.group)
+                    for post in self.get_queryset() if post.group_id
+                )
+
+        return FormSet
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    search_fields = ('title', 'slug')
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'text', 'post', 'author', 'created')
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
+    search_fields = ('text',)
+    # Диапазон дат и сортировка списка идут по индексу
+    # comment_created_idx.
+    list_filter = ('created',)
+    empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Comment)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Comment, CommentAdmin)
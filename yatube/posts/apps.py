@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    from .search import install_index
+    install_index(connections[using])
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,271 @@
+"""
+Замеры времени ответа страниц posts.urls через тестовый клиент Django.
+
+Для каждого адреса считаются перцентили времени ответа, число запросов
+к базе и пропускная способность. Адреса берутся из самых «тяжёлых»
+данных: самой большой группы, автора с наибольшим числом подписчиков,
+поста с наибольшим числом комментариев. Изменяющие запросы выполняются
+в транзакции, которая откатывается, поэтому база после замера не
+меняется. Кэш на время замера свой (BENCHMARK_CACHES), а записи в него
+изменяющих запросов тоже откатываются. Результаты сохраняются в JSON
+для сравнения между запусками.
+"""
+import contextlib
+import datetime
+import math
+import platform
+import time
+from collections import namedtuple
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import urls
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+# Адрес не из INTERNAL_IPS, чтобы debug_toolbar не встраивался в ответы.
+REMOTE_ADDR = '192.0.2.1'
+
+# Замер не должен остывлять общий кэш сайта и оставлять в нём версии и
+# id из откатанных записей, поэтому у него свой кэш в памяти процесса.
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'posts-benchmark',
+    },
+}
+
+Scenario = namedtuple(
+    'Scenario', 'name method url data login writes setup',
+    defaults=(None, False, False, None),
+)
+
+
+def percentile(values, percent):
+    """Перцентиль с линейной интерполяцией между соседними значениями."""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def summarize(timings, queries, elapsed):
+    """Сводка по замерам одного адреса; время — в миллисекундах."""
+    summary = {
+        f'p{percent}_ms': round(percentile(timings, percent) * 1000, 3)
+        for percent in PERCENTILES
+    }
+    summary['mean_ms'] = round(sum(timings) / len(timings) * 1000, 3)
+    summary['queries'] = round(sum(queries) / len(queries), 2)
+    summary['requests_per_second'] = round(len(timings) / elapsed, 1)
+    summary['requests'] = len(timings)
+    return summary
+
+
+def sample_objects():
+    """Объекты с наибольшим объёмом данных для подстановки в адреса."""
+    post = Post.objects.order_by('-comment_count', '-pk').first()
+    if post is None:
+        raise ValueError('В базе нет постов: сначала запустите seed_load.')
+    group = Group.objects.annotate(
+        total=Count('posts')).order_by('-total', 'pk').first()
+    # Счётчики подписок берутся из UserStats, а не считаются по Follow.
+    author = User.objects.order_by(
+        F('stats__followers_count').desc(nulls_last=True), 'pk').first()
+    reader = User.objects.exclude(pk=author.pk).order_by(
+        F('stats__following_count').desc(nulls_last=True), 'pk'
+    ).first() or author
+    word = next((word for word in post.text.split() if len(word) > 3),
+                post.text.split()[0])
+    return {
+        'post': post,
+        'group': group,
+        'author': author,
+        'reader': reader,
+        'word': word.strip('.,;:!?«»'),
+    }
+
+
+def build_scenarios(objects):
+    """
+    Сценарии для всех именованных адресов posts.urls.
+
+    Если в urls появится адрес без сценария, это будет ошибкой, чтобы
+    замеры не отставали от набора страниц.
+    """
+    post, group = objects['post'], objects['group']
+    author = objects['author']
+
+    def follow(client_user):
+        Follow.objects.get_or_create(user=client_user, author=author)
+
+    scenarios = [
+        Scenario('home', 'get', reverse('posts:home')),
+        Scenario('profile', 'get',
+                 reverse('posts:profile', args=[author.username])),
+        Scenario('post_detail', 'get',
+                 reverse('posts:post_detail', args=[post.pk])),
+        Scenario('post_comments', 'get',
+                 reverse('posts:post_comments', args=[post.pk])),
+        Scenario('search', 'get', reverse('posts:search'),
+                 {'q': objects['word']}),
+        Scenario('post_create', 'get', reverse('posts:post_create'),
+                 login=True),
+        Scenario('post_edit', 'get',
+                 reverse('posts:post_edit', args=[post.pk]),
+                 login='post_author'),
+        Scenario('follow_index', 'get', reverse('posts:follow_index'),
+                 login=True),
+        Scenario('add_comment', 'post',
+                 reverse('posts:add_comment', args=[post.pk]),
+                 {'text': 'Комментарий для замера'}, login=True,
+                 writes=True),
+        Scenario('profile_follow', 'get',
+                 reverse('posts:profile_follow', args=[author.username]),
+                 login=True, writes=True),
+        Scenario('profile_unfollow', 'get',
+                 reverse('posts:profile_unfollow', args=[author.username]),
+                 login=True, writes=True, setup=follow),
+        Scenario('api_follow', 'post',
+                 reverse('posts:api_follow', args=[author.username]),
+                 login=True, writes=True),
+        Scenario('api_unfollow', 'post',
+                 reverse('posts:api_unfollow', args=[author.username]),
+                 login=True, writes=True, setup=follow),
+    ]
+    if group is not None:
+        scenarios.insert(1, Scenario(
+            'group_posts', 'get',
+            reverse('posts:group_posts', args=[group.slug])))
+    names = {pattern.name for pattern in urls.urlpatterns}
+    missing = names - {scenario.name for scenario in scenarios}
+    if group is None:
+        missing.discard('group_posts')
+    if missing:
+        raise ValueError(
+            'Нет сценариев для адресов: ' + ', '.join(sorted(missing)))
+    return scenarios
+
+
+@contextlib.contextmanager
+def restored_cache():
+    """Возвращает кэш замера (LocMemCache) в состояние до блока."""
+    saved = dict(cache._cache), dict(cache._expire_info)
+    try:
+        yield
+    finally:
+        for storage, values in zip((cache._cache, cache._expire_info), saved):
+            storage.clear()
+            storage.update(values)
+
+
+class Benchmark:
+    """
+    Прогон сценариев: warmup запросов без замера, затем iterations.
+
+    Scenario.login: False — аноним, True — читатель с наибольшим числом
+    подписок, 'post_author' — автор замеряемого поста.
+    """
+
+    def __init__(self, iterations=50, warmup=5, only=None, progress=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.only = only
+        self.progress = progress or (lambda name, result: None)
+        self.objects = sample_objects()
+        self.clients = {False: Client(REMOTE_ADDR=REMOTE_ADDR)}
+        for login, user in ((True, self.objects['reader']),
+                            ('post_author', self.objects['post'].author)):
+            self.clients[login] = Client(REMOTE_ADDR=REMOTE_ADDR)
+            self.clients[login].force_login(user)
+
+    def request(self, scenario):
+        send = getattr(self.clients[scenario.login], scenario.method)
+        if not scenario.writes:
+            return send(scenario.url, scenario.data)
+        # Изменения базы и кэша откатываются, чтобы каждый запрос и
+        # следующие сценарии видели те же данные и тот же тёплый кэш.
+        with restored_cache(), transaction.atomic():
+            if scenario.setup is not None:
+                scenario.setup(self.objects['reader'])
+            response = send(scenario.url, scenario.data)
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, scenario):
+        for _ in range(self.warmup):
+            self.request(scenario)
+        timings, queries = [], []
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.request(scenario)
+                timings.append(time.perf_counter() - start)
+            queries.append(len(captured))
+        summary = summarize(
+            timings, queries, time.perf_counter() - started)
+        summary['url'] = scenario.url
+        summary['status'] = response.status_code
+        return summary
+
+    def run(self):
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            return self._run()
+
+    def _run(self):
+        scenarios = build_scenarios(self.objects)
+        results = {}
+        for scenario in scenarios:
+            if self.only and scenario.name not in self.only:
+                continue
+            results[scenario.name] = self.measure(scenario)
+            self.progress(scenario.name, results[scenario.name])
+        return {'meta': self.meta(), 'results': results}
+
+    def meta(self):
+        return {
+            'created': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': self.iterations,
+            'warmup': self.warmup,
+            'rows': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+        }
+
+
+def compare(previous, current, threshold=0.1, metric='p95_ms'):
+    """
+    Адреса, у которых metric выросла больше чем на долю threshold.
+
+    Возвращает список (имя, было, стало).
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if before is None or not before.get(metric):
+            continue
+        if result[metric] > before[metric] * (1 + threshold):
+            regressions.append((name, before[metric], result[metric]))
+    return regressions
@@ -0,0 +1,102 @@
+"""
+Версии для ключей кэша фрагментов шаблонов.
+
+Каждая область (scope) — например, 'posts', 'group:3', 'author:7',
+'post:42' — хранит в кэше счётчик. Фрагмент кэшируется под ключом,
+включающим версии областей, от которых он зависит, а сигналы
+моделей увеличивают версии при записи. Поэтому фрагменты можно
+держать часами: после изменения данных ключ просто меняется.
+
+Версия — это время последнего изменения области в миллисекундах
+(или чуть больше при одновременных записях): после очистки кэша версии
+не повторяют уже выданные значения.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.views.decorators.http import condition
+
+VERSION_KEY = 'posts:version:{}'
+
+
+def _initial_version():
+    return int(time.time() * 1000)
+
+
+def _get_versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(*scopes):
+    """Строка с версиями областей scopes для ключа фрагмента."""
+    return '.'.join(str(version) for version in _get_versions(scopes))
+
+
+def _bump(scopes):
+    now = _initial_version()
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        current = cache.get(key)
+        if current is None and cache.add(key, now, timeout=None):
+            continue
+        try:
+            # incr атомарен: версия растёт даже при гонке записей.
+            cache.incr(key, max(now - (current or now), 1))
+        except ValueError:
+            cache.add(key, now, timeout=None)
+
+
+def bump(*scopes):
+    """
+    Увеличивает версии областей scopes.
+
+    Внутри транзакции версии увеличиваются ещё раз после фиксации,
+    чтобы фрагмент, закэшированный до коммита, не пережил его.
+    """
+    scopes = set(scopes)
+    _bump(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def fragment_context(*scopes):
+    """Контекст для {% cache cache_timeout name cache_version ... %}."""
+    return {
+        'cache_version': get_version(*scopes),
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+
+def conditional_page(get_scopes):
+    """
+    Отвечает 304 Not Modified, если версии страницы не изменились.
+
+    get_scopes(request, *args, **kwargs) возвращает области кэша, от
+    которых зависит страница, или None, если её не существует. ETag
+    учитывает ещё пользователя и параметры запроса, потому что от них
+    зависит разметка.
+
+    Last-Modified не отдаётся: в нём только секунды, и две записи за
+    одну секунду дали бы устаревший ответ 304 на If-Modified-Since.
+    """
+    def etag(request, *args, **kwargs):
+        scopes = get_scopes(request, *args, **kwargs)
+        if not scopes:
+            return None
+        raw = ':'.join((
+            str(request.user.pk),
+            get_version(*scopes),
+            request.GET.urlencode(),
+        ))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    return condition(etag_func=etag)
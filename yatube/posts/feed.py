@@ -0,0 +1,134 @@
+"""
+Лента подписок с раскладкой при записи (fan-out-on-write).
+
+Новый пост копируется в FeedEntry каждого подписчика автора, поэтому
+чтение ленты — один проход по индексу (user, -pub_date, -post).
+Авторы, у которых подписчиков больше FEED_FANOUT_LIMIT, не
+раскладываются: их посты добавляются в ленту при чтении (гибридный
+режим). FEED_FANOUT_LIMIT = None раскладывает посты всех авторов.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import FeedEntry, Follow, Post, UserStats
+from .utils import get_paginator
+
+FEED_KEYS = ('pub_date', 'post_id')
+BATCH_SIZE = 1000
+
+
+def is_celebrity(author_id):
+    """Посты автора читаются при чтении ленты, а не раскладываются."""
+    limit = settings.FEED_FANOUT_LIMIT
+    return limit is not None and UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=limit).exists()
+
+
+def _copy(user_ids, author_id, posts):
+    """Добавляет посты [(pk, pub_date)] автора в ленты user_ids."""
+    batch = []
+    with transaction.atomic():
+        for user_id in user_ids:
+            for pk, pub_date in posts:
+                batch.append(FeedEntry(
+                    user_id=user_id,
+                    post_id=pk,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    FeedEntry.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    batch = []
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _latest_posts(author_id):
+    return list(Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL])
+
+
+def _followers(author_id):
+    return Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True).iterator(chunk_size=BATCH_SIZE)
+
+
+def fan_out_post(post):
+    """Добавляет пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    _copy(_followers(post.author_id), post.author_id,
+          [(post.pk, post.pub_date)])
+
+
+def move_post(post):
+    """Перекладывает пост по лентам после смены автора."""
+    with transaction.atomic():
+        FeedEntry.objects.filter(post_id=post.pk).delete()
+        fan_out_post(post)
+
+
+def backfill(user_id, author_id):
+    """Копирует в ленту последние FEED_BACKFILL постов нового автора."""
+    if is_celebrity(author_id):
+        return
+    _copy([user_id], author_id, _latest_posts(author_id))
+
+
+def follower_left(author_id):
+    """
+    Раскладывает посты автора, переставшего быть знаменитостью.
+
+    Пока подписчиков было больше FEED_FANOUT_LIMIT, посты не копировались
+    в ленты, а теперь лента читает только FeedEntry. Обратный переход
+    ничего не требует: посты знаменитости добавляются при чтении, а
+    старые записи ленты с ними не дублируются.
+    """
+    limit = settings.FEED_FANOUT_LIMIT
+    if limit is None or not UserStats.objects.filter(
+            user_id=author_id, followers_count=limit).exists():
+        return
+    _copy(_followers(author_id), author_id, _latest_posts(author_id))
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_ids=None, batch_size=BATCH_SIZE):
+    """Пересобирает ленты user_ids (по умолчанию все) по подпискам."""
+    follows = Follow.objects.values_list('user_id', 'author_id').order_by()
+    entries = FeedEntry.objects.all()
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    total = 0
+    with transaction.atomic():
+        entries.delete()
+        for user_id, author_id in follows.iterator(chunk_size=batch_size):
+            backfill(user_id, author_id)
+            total += 1
+    return total
+
+
+def get_feed_page(request, user):
+    """Страница ленты подписок user."""
+    limit = settings.FEED_FANOUT_LIMIT
+    celebrities = []
+    if limit is not None:
+        celebrities = list(Follow.objects.filter(
+            user=user, author__stats__followers_count__gt=limit,
+        ).values_list('author_id', flat=True))
+    if celebrities:
+        posts = Post.objects.filter(
+            Q(pk__in=FeedEntry.objects.filter(user=user).values('post_id'))
+            | Q(author_id__in=celebrities)
+        ).select_related('author', 'group')
+        return get_paginator(request, posts)
+    entries = FeedEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+    page_obj = get_paginator(request, entries, keys=FEED_KEYS)
+    page_obj.object_list = [entry.post for entry in page_obj.object_list]
+    return page_obj
@@ -0,0 +1,89 @@
+"""
+Граф подписок в кэше.
+
+Для каждого пользователя в кэше лежит отсортированный массив id авторов,
+на которых он подписан (array('I'), по 4 байта на подписку), а для
+каждого автора — число подписчиков из UserStats. Поэтому состояние
+кнопок «Подписаться» и счётчики для всех авторов страницы стоят одного
+чтения кэша каждого вида, а база читается только при промахе.
+
+Сигналы Follow (posts.signals) вызывают forget для читателя и автора;
+импорт (posts.transfer) делает то же для всех затронутых пользователей.
+"""
+import bisect
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow, UserStats
+
+FOLLOWING_KEY = 'posts:following:{}'
+FOLLOWERS_KEY = 'posts:followers:{}'
+
+
+def following_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    key = FOLLOWING_KEY.format(user_id)
+    raw = cache.get(key)
+    ids = array('I')
+    if raw is None:
+        ids.extend(Follow.objects.filter(user_id=user_id).order_by(
+            'author_id').values_list('author_id', flat=True))
+        cache.set(key, ids.tobytes(), settings.FOLLOW_GRAPH_TIMEOUT)
+    else:
+        ids.frombytes(raw)
+    return ids
+
+
+def is_following(user, author_ids):
+    """Словарь {id автора: подписан ли на него user}."""
+    author_ids = set(author_ids)
+    if not user.is_authenticated or not author_ids:
+        return dict.fromkeys(author_ids, False)
+    ids = following_ids(user.pk)
+
+    def contains(author_id):
+        index = bisect.bisect_left(ids, author_id)
+        return index < len(ids) and ids[index] == author_id
+
+    return {author_id: contains(author_id) for author_id in author_ids}
+
+
+def followers_count(author_ids):
+    """Словарь {id автора: число подписчиков}."""
+    keys = {FOLLOWERS_KEY.format(pk): pk for pk in set(author_ids)}
+    cached = cache.get_many(keys)
+    counts = {keys[key]: count for key, count in cached.items()}
+    missing = [pk for key, pk in keys.items() if key not in cached]
+    if missing:
+        found = dict.fromkeys(missing, 0)
+        found.update(UserStats.objects.filter(user_id__in=missing)
+                     .values_list('user_id', 'followers_count'))
+        cache.set_many(
+            {FOLLOWERS_KEY.format(pk): count for pk, count in found.items()},
+            settings.FOLLOW_GRAPH_TIMEOUT,
+        )
+        counts.update(found)
+    return counts
+
+
+def _forget(keys):
+    cache.delete_many(keys)
+
+
+def forget(user_ids=(), author_ids=()):
+    """
+    Удаляет из кэша подписки user_ids и счётчики author_ids.
+
+    Внутри транзакции ключи удаляются ещё раз после фиксации, чтобы
+    чтение незафиксированного состояния не осталось в кэше.
+    """
+    keys = [FOLLOWING_KEY.format(pk) for pk in user_ids]
+    keys += [FOLLOWERS_KEY.format(pk) for pk in author_ids]
+    if not keys:
+        return
+    _forget(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _forget(keys))
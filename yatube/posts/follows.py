@@ -0,0 +1,75 @@
+"""
+Подписка и отписка одним запросом к базе.
+
+Автор ищется по username прямо в запросе, поэтому отдельной выборки
+пользователя нет. INSERT ... ON CONFLICT DO NOTHING опирается на
+ограничение unique_follow: одновременные подписки не создают дублей, а
+повторная просто ничего не меняет. Подписка на себя отсекается условием
+в запросе (и ограничением no_self_follow). Запросы пишут мимо ORM,
+поэтому сигналов Follow нет: счётчики, ленты и кэш обновляются явным
+вызовом follow_added и follow_removed из posts.signals.
+
+id автора возвращается тем же запросом (RETURNING). В SQLite старше
+3.35 RETURNING нет: там после удачной записи id автора читается
+отдельно. Запросы рассчитаны на SQLite и PostgreSQL.
+"""
+from django.db import connection, transaction
+
+from .models import Follow, User
+from .signals import follow_added, follow_removed
+
+FOLLOW_TABLE = Follow._meta.db_table
+USER_TABLE = User._meta.db_table
+INSERT_SQL = (
+    f'INSERT INTO {FOLLOW_TABLE} (user_id, author_id) '
+    f'SELECT %s, id FROM {USER_TABLE} WHERE username = %s AND id <> %s '
+    f'ON CONFLICT DO NOTHING'
+)
+DELETE_SQL = (
+    f'DELETE FROM {FOLLOW_TABLE} WHERE user_id = %s AND author_id = ('
+    f'SELECT id FROM {USER_TABLE} WHERE username = %s)'
+)
+
+
+def supports_returning(conn=connection):
+    if conn.vendor == 'sqlite':
+        return conn.Database.sqlite_version_info >= (3, 35, 0)
+    return True
+
+
+def _write(sql, params, username):
+    """Выполняет запись; id автора, если строка изменилась, иначе None."""
+    returning = supports_returning()
+    with connection.cursor() as cursor:
+        if returning:
+            cursor.execute(f'{sql} RETURNING author_id', params)
+            row = cursor.fetchone()
+            return row and row[0]
+        cursor.execute(sql, params)
+        if cursor.rowcount != 1:
+            return None
+    return User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+
+
+def follow(user_id, username):
+    """
+    Подписывает user_id на автора username.
+
+    Возвращает id автора, если подписка появилась, иначе None: автора
+    нет, это сам пользователь или подписка уже была.
+    """
+    with transaction.atomic():
+        author_id = _write(INSERT_SQL, [user_id, username, user_id], username)
+        if author_id is not None:
+            follow_added(user_id, author_id)
+    return author_id
+
+
+def unfollow(user_id, username):
+    """Отписывает user_id от автора username; id автора или None."""
+    with transaction.atomic():
+        author_id = _write(DELETE_SQL, [user_id, username], username)
+        if author_id is not None:
+            follow_removed(user_id, author_id)
+    return author_id
@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
 
+from posts import lookups
 from posts.models import Post, Comment
+from posts.uploads import process_upload
 
 User = get_user_model()
 
@@ -12,6 +15,18 @@ class PostForm(forms.ModelForm):
         labels = {'group': 'Группа', 'text': 'Текст поста'}
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Список групп для <select> берётся из кэша, а не из базы.
+        lookups.groups.bind(self.fields['group'])
+
+    def clean_image(self):
+        """Проверяет размеры новой картинки и убирает из неё EXIF."""
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return process_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
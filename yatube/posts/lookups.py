@@ -0,0 +1,68 @@
+"""
+Справочники для полей выбора в формах из кэша с версией области.
+
+Версию области увеличивают сигналы моделей (см. group_changed).
+"""
+import functools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.forms.models import ModelChoiceIterator
+
+from .cache_versions import get_version
+from .models import Group
+
+LOOKUP_KEY = 'posts:lookup:{}:{}'
+
+
+class CachedChoiceIterator(ModelChoiceIterator):
+    """Варианты ModelChoiceField из CachedLookup вместо запроса."""
+
+    def __init__(self, field, lookup):
+        super().__init__(field)
+        self.lookup = lookup
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.lookup.all():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return (len(self.lookup.all())
+                + (1 if self.field.empty_label is not None else 0))
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.lookup.all())
+
+
+class CachedLookup:
+    """Объекты get_queryset(), закэшированные до смены версии scope."""
+
+    def __init__(self, scope, get_queryset):
+        self.scope = scope
+        self.get_queryset = get_queryset
+        # (версия, объекты) — память процесса поверх общего кэша.
+        self._memo = None
+
+    def all(self):
+        version = get_version(self.scope)
+        memo = self._memo
+        if memo is not None and memo[0] == version:
+            return memo[1]
+        key = LOOKUP_KEY.format(self.scope, version)
+        objects = cache.get(key)
+        if objects is None:
+            objects = list(self.get_queryset())
+            cache.set(key, objects, settings.LOOKUP_CACHE_TIMEOUT)
+        self._memo = (version, objects)
+        return objects
+
+    def bind(self, field):
+        """Берёт варианты ModelChoiceField из этого справочника."""
+        field.iterator = functools.partial(CachedChoiceIterator, lookup=self)
+        field.widget.choices = field.choices
+
+
+# Версию 'groups' увеличивает сигнал group_changed (posts.signals).
+groups = CachedLookup('groups', Group.objects.all)
@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа и число запросов к базе для страниц '
+        'posts.urls; с --compare сравнивает с прошлым запуском.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='Сколько замеров делать для каждого адреса.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Сколько запросов сделать до замеров.',
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='NAME',
+            help='Имена адресов из posts.urls, которые нужно замерить.',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для сохранения результатов в JSON.',
+        )
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='Результаты прошлого запуска для сравнения.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Допустимый рост p95 при сравнении, доля.',
+        )
+
+    def progress(self, name, result):
+        self.stdout.write(
+            f'{name:<18} p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'p99 {result["p99_ms"]:>8.2f} мс  '
+            f'запросов {result["queries"]:>6.1f}  '
+            f'{result["requests_per_second"]:>7.1f} в секунду'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужен хотя бы один замер.')
+        try:
+            runner = benchmark.Benchmark(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                only=options['only'],
+                progress=self.progress,
+            )
+            report = runner.run()
+        except ValueError as error:
+            raise CommandError(error)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if not options['compare']:
+            return
+        with open(options['compare'], encoding='utf-8') as previous:
+            regressions = benchmark.compare(
+                json.load(previous), report, options['threshold'])
+        for name, before, after in regressions:
+            self.stderr.write(
+                f'{name}: p95 {before:.2f} мс → {after:.2f} мс')
+        if regressions:
+            raise CommandError(
+                f'Замедлились адреса: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Замедлений нет'))
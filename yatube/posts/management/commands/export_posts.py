@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в JSONL или CSV '
+        'потоком, не загружая таблицы в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки; по умолчанию стандартный вывод.',
+        )
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='jsonl',
+            help='Формат выгрузки.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        records = transfer.export_records(chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as stream:
+                total = transfer.write_records(
+                    records, stream, options['format'])
+        else:
+            total = transfer.write_records(
+                records, self.stdout, options['format'])
+        self.stderr.write(f'Выгружено записей: {total}')
@@ -0,0 +1,49 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает выгрузку export_posts пачками через bulk_create. '
+        'С --checkpoint прерванный импорт продолжается с последней пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки (.jsonl или .csv).')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS,
+            help='Формат файла; по умолчанию — по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей вставлять за один запрос.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки для продолжения импорта.',
+        )
+
+    def progress(self, done, rate):
+        self.stderr.write(f'Записей: {done}, {rate:.0f} в секунду')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format_ = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if format_ not in transfer.FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        importer = transfer.Importer(
+            batch_size=options['batch_size'],
+            checkpoint=options['checkpoint'],
+            progress=self.progress,
+        )
+        with open(path, newline='', encoding='utf-8') as stream:
+            try:
+                total = importer.run(transfer.read_records(stream, format_))
+            except transfer.ImportConflict as error:
+                raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено записей: {total}, пропущено: {importer.skipped}'
+        ))
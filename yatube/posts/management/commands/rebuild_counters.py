@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post, UserStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает с нуля денормализованные счётчики пользователей '
+        'и комментариев постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        created = UserStats.objects.rebuild(batch_size=options['batch_size'])
+        posts = Post.objects.recount_comments()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счётчики пользователей: {created}, '
+            f'постов: {posts}'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок по текущим подпискам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=feed.BATCH_SIZE,
+            help='Сколько подписок читать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        total = feed.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобраны ленты по подпискам: {total}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов.'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite.')
+        search.install_index()
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Индекс поиска перестроен'))
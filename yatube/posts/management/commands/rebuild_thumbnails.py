@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заранее строит миниатюры для картинок всех постов.'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').values_list(
+            'pk', 'author_id', 'group_id', 'image').order_by()
+        total = 0
+        for pk, author_id, group_id, name in posts.iterator():
+            scopes = ['posts', f'post:{pk}', f'author:{author_id}']
+            if group_id is not None:
+                scopes.append(f'group:{group_id}')
+            thumbnails.build(name, scopes)
+            total += 1
+        # Ждём, пока пул построит и сохранит все миниатюры.
+        thumbnails.shutdown_executor()
+        self.stdout.write(self.style.SUCCESS(
+            f'Построены миниатюры для картинок: {total}'
+        ))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'подписками и комментариями для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Сколько пользователей создать.',
+        )
+        parser.add_argument(
+            '--posts', type=int, default=10000,
+            help='Сколько постов создать.',
+        )
+        parser.add_argument(
+            '--groups', type=int, default=20,
+            help='Сколько групп создать.',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--comments', type=int, default=30000,
+            help='Сколько комментариев создать.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты.',
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='Показатель степенного закона популярности.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк вставлять за один запрос.',
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Начальное значение генератора для повторяемых данных.',
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имён пользователей и slug групп.',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        seeder = Seeder(
+            users=options['users'],
+            posts=options['posts'],
+            groups=options['groups'],
+            follows=options['follows'],
+            comments=options['comments'],
+            days=options['days'],
+            alpha=options['alpha'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            progress=self.stderr.write,
+        )
+        seeder.run()
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
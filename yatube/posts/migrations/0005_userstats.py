@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_user_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def totals(queryset, field):
+        return dict(
+            queryset.order_by().values_list(field).annotate(Count('id'))
+        )
+
+    posts = totals(Post.objects, 'author')
+    followers = totals(Follow.objects, 'author')
+    following = totals(Follow.objects, 'user')
+    UserStats.objects.bulk_create(
+        UserStats(
+            user_id=pk,
+            posts_count=posts.get(pk, 0),
+            followers_count=followers.get(pk, 0),
+            following_count=following.get(pk, 0),
+        )
+        for pk in User.objects.values_list('pk', flat=True).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0004_post_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
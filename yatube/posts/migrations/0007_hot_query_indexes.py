@@ -0,0 +1,81 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    # Удаление через исторические модели не вызывает сигналов, поэтому
+    # счётчики и ленты затронутых пользователей пересчитываются здесь.
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    UserStats = apps.get_model('posts', 'UserStats')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    duplicates = Follow.objects.values('user', 'author').order_by().annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    pairs = []
+    for row in duplicates.iterator():
+        Follow.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(id=row['first_id']).delete()
+        pairs.append((row['user'], row['author']))
+    for user_id, author_id in pairs:
+        UserStats.objects.filter(user_id=user_id).update(
+            following_count=Follow.objects.filter(user_id=user_id).count())
+        UserStats.objects.filter(user_id=author_id).update(
+            followers_count=Follow.objects.filter(
+                author_id=author_id).count())
+        FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+        posts = Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    user_id=user_id,
+                    post_id=pk,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for pk, pub_date in posts
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_feedentry'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['created', 'id'], 'verbose_name': 'Комментарий', 'verbose_name_plural': 'Комментарии'},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:25
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def fill_image_size(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.exclude(image='').only('id', 'image')
+    for post in posts.iterator():
+        try:
+            width, height = get_image_dimensions(post.image)
+        except OSError:
+            continue
+        Post.objects.filter(pk=post.pk).update(
+            image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(fill_image_size, migrations.RunPython.noop),
+    ]
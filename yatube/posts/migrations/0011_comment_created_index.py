@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_last_comment_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created', 'id'], name='comment_created_idx'),
+        ),
+    ]
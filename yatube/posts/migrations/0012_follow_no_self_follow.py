@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:16
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def delete_self_follows(apps, schema_editor):
+    # Как и в 0007: сигналы не вызываются, поэтому счётчики и записи
+    # ленты пользователей, подписанных на себя, правятся здесь.
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    self_follows = Follow.objects.filter(
+        user=django.db.models.expressions.F('author'))
+    user_ids = list(self_follows.values_list('user_id', flat=True))
+    self_follows.delete()
+    for user_id in user_ids:
+        UserStats.objects.filter(user_id=user_id).update(
+            following_count=Follow.objects.filter(user_id=user_id).count(),
+            followers_count=Follow.objects.filter(author_id=user_id).count(),
+        )
+        FeedEntry.objects.filter(user_id=user_id, author_id=user_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_self_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('author')), name='no_self_follow'),
+        ),
+    ]
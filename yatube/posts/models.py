@@ -1,9 +1,24 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import (Count, F, IntegerField, OuterRef, Q,
+                              Subquery)
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
 
+class AtomicSaveMixin:
+    """
+    save() в одной транзакции с обработчиками post_save: счётчики
+    (UserStats, Post.comment_count) меняются вместе с самой записью.
+    Удаление атомарно и так: Collector удаляет всё в транзакции.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=400, unique=True)
@@ -18,7 +33,21 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostManager(models.Manager):
+    def recount_comments(self, posts=None):
+        """Пересчитывает comment_count и last_comment_at у posts (всех)."""
+        if posts is None:
+            posts = self.all()
+        return posts.update(
+            comment_count=_count_subquery(Comment, 'post'),
+            last_comment_at=last_comment_subquery(),
+        )
+
+
+COMMENT_COUNTER_FIELDS = ('comment_count', 'last_comment_at')
+
+
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -47,17 +76,65 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    # Размеры картинки заполняет сигнал при загрузке, чтобы шаблоны
+    # не открывали файл (width_field у ImageField читает его при
+    # каждой загрузке поста без заполненных размеров).
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    # Число комментариев и время последнего поддерживают сигналы Comment.
+    comment_count = models.PositiveIntegerField(
+        'Комментариев', default=0, editable=False)
+    last_comment_at = models.DateTimeField(
+        'Последний комментарий', null=True, blank=True, editable=False)
+
+    objects = PostManager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Счётчики комментариев меняются только через update(): при
+        # сохранении загруженного поста их значения могли устареть.
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in COMMENT_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Запоминаем загруженные значения, чтобы сигналы видели,
+        # что изменилось при сохранении (например, автор).
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -76,12 +153,21 @@ class Comment(models.Model):
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            ),
+            models.Index(
+                fields=['created', 'id'], name='comment_created_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -92,3 +178,141 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='follower',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+            models.CheckConstraint(
+                check=~Q(user=F('author')),
+                name='no_self_follow'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Пост в ленте подписок пользователя, разложенный при записи."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-post_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+def last_comment_subquery():
+    """Время последнего комментария поста (для update и annotate)."""
+    return Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by(
+            '-created', '-id').values('created')[:1]
+    )
+
+
+def _count_subquery(model, field):
+    queryset = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+
+class UserStatsManager(models.Manager):
+    def counted(self, users):
+        """Пользователи с заново подсчитанными счётчиками."""
+        return users.annotate(
+            posts_total=_count_subquery(Post, 'author'),
+            followers_total=_count_subquery(Follow, 'author'),
+            following_total=_count_subquery(Follow, 'user'),
+        )
+
+    def rebuild(self, users=None, batch_size=1000):
+        """Пересчитывает счётчики с нуля для users (по умолчанию всех)."""
+        if users is None:
+            users = User.objects.all()
+        rows = self.counted(users).values_list(
+            'pk', 'posts_total', 'followers_total', 'following_total'
+        ).order_by('pk')
+        created = 0
+        with transaction.atomic():
+            self.filter(user__in=users.values('pk')).delete()
+            batch = []
+            for pk, posts, followers, following in rows.iterator(
+                    chunk_size=batch_size):
+                batch.append(self.model(
+                    user_id=pk,
+                    posts_count=posts,
+                    followers_count=followers,
+                    following_count=following,
+                ))
+                if len(batch) >= batch_size:
+                    created += len(self.bulk_create(batch))
+                    batch = []
+            created += len(self.bulk_create(batch))
+        return created
+
+    def for_user(self, user):
+        """Счётчики пользователя; отсутствующая строка считается заново."""
+        try:
+            return user.stats
+        except self.model.DoesNotExist:
+            pass
+        try:
+            self.rebuild(User.objects.filter(pk=user.pk))
+        except IntegrityError:
+            # Строку уже пересчитал параллельный запрос.
+            pass
+        user.stats = self.get(user=user)
+        return user.stats
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    objects = UserStatsManager()
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.posts_count}'
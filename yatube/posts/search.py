@@ -0,0 +1,186 @@
+"""
+Полнотекстовый поиск по постам.
+
+В SQLite используется внешний FTS5-индекс posts_post_fts над
+posts_post.text, который синхронизируют триггеры на вставку, изменение
+и удаление постов. Индекс и триггеры создаются после каждой миграции
+(install_index): SQLite пересоздаёт таблицу при изменении схемы и при
+этом удаляет её триггеры. На других СУБД поиск сводится к icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+INSTALL_SQL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+TERM = re.compile(r'\w+')
+
+
+def is_supported(conn=connection):
+    return conn.vendor == 'sqlite'
+
+
+def install_index(conn=connection):
+    """Создаёт FTS-таблицу и триггеры; новую таблицу сразу заполняет."""
+    if not is_supported(conn):
+        return
+    # migrate других приложений может идти раньше, чем создана posts_post.
+    if Post._meta.db_table not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        created = cursor.fetchone() is None
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+    if created:
+        rebuild_index(conn)
+
+
+def rebuild_index(conn=connection):
+    """Перестраивает индекс целиком по содержимому posts_post."""
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def build_match(query):
+    """
+    Запрос пользователя в синтаксисе MATCH.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 во вводе
+    не интерпретируются; все слова должны встретиться в посте.
+    """
+    return ' '.join(f'"{term}"' for term in TERM.findall(query.lower()))
+
+
+class RawSubquery(RawSQL):
+    """
+    Подзапрос для __in. RawSQL сам берёт SQL в скобки, а lookup
+    добавляет вторые: id IN ((SELECT ...)) сравнивает id только с первой
+    строкой подзапроса.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def filter_posts(queryset, query):
+    """Сужает queryset до постов, подходящих под query (без ранжирования)."""
+    match = build_match(query)
+    if not match:
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSubquery(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match],
+    ))
+
+
+class SearchResults:
+    """
+    Результаты поиска, упорядоченные по релевантности (bm25).
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator:
+    срез выбирает из индекса только идентификаторы нужной страницы.
+    Доступны только первые SEARCH_MAX_RESULTS результатов, поэтому
+    ни подсчёт, ни OFFSET дальних страниц не растут с числом совпадений.
+    """
+
+    def __init__(self, query, author_id=None, group_id=None):
+        self.match = build_match(query)
+        self.conditions = [f'{FTS_TABLE} MATCH %s']
+        self.params = [self.match]
+        if author_id is not None:
+            self.conditions.append('posts_post.author_id = %s')
+            self.params.append(author_id)
+        if group_id is not None:
+            self.conditions.append('posts_post.group_id = %s')
+            self.params.append(group_id)
+
+    def _select(self, select, suffix=''):
+        return (
+            f'SELECT {select} FROM {FTS_TABLE} '
+            f'JOIN posts_post ON posts_post.id = {FTS_TABLE}.rowid '
+            f'WHERE {" AND ".join(self.conditions)} {suffix}'
+        )
+
+    def _execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, self.params + list(params))
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.match:
+            return 0
+        sql = f'SELECT COUNT(*) FROM ({self._select("1", "LIMIT %s")})'
+        return self._execute(sql, [settings.SEARCH_MAX_RESULTS])[0][0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop
+        if stop is not None:
+            stop = min(stop, settings.SEARCH_MAX_RESULTS)
+        if not self.match or stop is None or stop <= start:
+            return []
+        rows = self._execute(
+            self._select(
+                'posts_post.id',
+                f'ORDER BY {FTS_TABLE}.rank LIMIT %s OFFSET %s',
+            ),
+            (stop - start, start),
+        )
+        ids = [row[0] for row in rows]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query, author_id=None, group_id=None):
+    """Посты по запросу query с фильтрами по автору и группе."""
+    if is_supported():
+        return SearchResults(query, author_id, group_id)
+    posts = filter_posts(
+        Post.objects.select_related('author', 'group'), query)
+    if author_id is not None:
+        posts = posts.filter(author_id=author_id)
+    if group_id is not None:
+        posts = posts.filter(group_id=group_id)
+    return posts
@@ -0,0 +1,169 @@
+"""
+Генерация синтетических данных для нагрузочных замеров.
+
+Популярность авторов и постов распределена по степенному закону: у
+немногих авторов большая часть подписчиков и постов, у немногих постов
+большая часть комментариев. Все записи вставляются пачками через
+bulk_create, после чего пересчитывается то, что обычно поддерживают
+сигналы (см. posts.transfer).
+"""
+import datetime
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from faker import Faker
+
+from . import transfer
+from .models import Comment, Follow, Group, Post, User
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса рангов 1..count с показателем alpha."""
+    return list(itertools.accumulate(
+        1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Seeder:
+    """
+    Заполняет базу: users пользователей, groups групп, posts постов,
+    в среднем follows подписок на пользователя и comments комментариев.
+    """
+
+    def __init__(self, users, posts, groups=20, follows=20, comments=0,
+                 days=365, alpha=1.2, batch_size=5000, seed=None,
+                 prefix='seed', progress=None):
+        self.users = users
+        self.posts = posts
+        self.groups = groups
+        self.follows = follows
+        self.comments = comments
+        self.days = days
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.progress = progress or (lambda message: None)
+        self.random = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.now = timezone.now()
+
+    def run(self):
+        user_ids = self.create_users()
+        group_ids = self.create_groups()
+        weights = power_law_weights(len(user_ids), self.alpha)
+        with transfer.preserve_dates():
+            post_ids = self.create_posts(user_ids, group_ids, weights)
+            self.create_follows(user_ids, weights)
+            self.create_comments(user_ids, post_ids)
+        self.progress('Пересчёт счётчиков и лент')
+        transfer.Importer(batch_size=self.batch_size).finish(rebuild_all=True)
+
+    def insert(self, model, objects, label):
+        """
+        Вставляет объекты пачками; возвращает queryset новых строк.
+
+        Новые строки определяются по первичному ключу больше прежнего
+        максимума, а не длинным списком в IN.
+        """
+        last_pk = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        total = 0
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+            self.progress(f'{label}: {total}')
+        return model.objects.filter(pk__gt=last_pk).order_by('pk')
+
+    def random_date(self):
+        return self.now - datetime.timedelta(
+            seconds=self.random.uniform(0, self.days * 86400))
+
+    def create_users(self):
+        password = make_password(None)
+        start = User.objects.filter(
+            username__startswith=self.prefix).count()
+        names = [f'{self.prefix}{number}'
+                 for number in range(start, start + self.users)]
+        created = self.insert(User, (
+            User(
+                username=name,
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password=password,
+            )
+            for name in names
+        ), 'Пользователи')
+        # Порядок вставки задаёт ранг популярности пользователя.
+        return list(created.values_list('pk', flat=True))
+
+    def create_groups(self):
+        start = Group.objects.filter(slug__startswith=self.prefix).count()
+        slugs = [f'{self.prefix}-{number}'
+                 for number in range(start, start + self.groups)]
+        created = self.insert(Group, (
+            Group(
+                slug=slug,
+                title=self.fake.catch_phrase()[:200],
+                description=self.fake.paragraph(),
+            )
+            for slug in slugs
+        ), 'Группы')
+        return list(created.values_list('pk', flat=True))
+
+    def create_posts(self, user_ids, group_ids, weights):
+        authors = self.random.choices(
+            user_ids, cum_weights=weights, k=self.posts)
+        created = self.insert(Post, (
+            Post(
+                author_id=author_id,
+                group_id=(self.random.choice(group_ids)
+                          if group_ids and self.random.random() < 0.5
+                          else None),
+                text=self.fake.paragraph(nb_sentences=5),
+                pub_date=self.random_date(),
+            )
+            for author_id in authors
+        ), 'Посты')
+        return list(created.values_list('pk', flat=True))
+
+    def create_follows(self, user_ids, weights):
+        def follows():
+            for user_id in user_ids:
+                count = min(
+                    int(self.random.expovariate(1 / self.follows)) + 1,
+                    len(user_ids) - 1,
+                )
+                authors = set(self.random.choices(
+                    user_ids, cum_weights=weights, k=count))
+                authors.discard(user_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+        self.insert(Follow, follows(), 'Подписки')
+
+    def create_comments(self, user_ids, post_ids):
+        if not self.comments or not post_ids:
+            return
+        # Популярность постов не связана с их порядком в базе.
+        popular = self.random.sample(post_ids, len(post_ids))
+        weights = power_law_weights(len(popular), self.alpha)
+        self.insert(Comment, (
+            Comment(
+                post_id=post_id,
+                author_id=self.random.choice(user_ids),
+                text=self.fake.sentence(),
+                created=self.random_date(),
+            )
+            for post_id in self.random.choices(
+                popular, cum_weights=weights, k=self.comments)
+        ), 'Комментарии')
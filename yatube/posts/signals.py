@@ -0,0 +1,225 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.images import get_image_dimensions
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import feed, follow_graph, thumbnails
+from .cache_versions import bump
+from .models import (Comment, Follow, Group, Post, User, UserStats,
+                     last_comment_subquery)
+
+
+def bump_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя на deltas."""
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def post_scopes(post, author_id=None, group_id=None):
+    """Области кэша, которые затрагивает пост."""
+    scopes = ['posts', f'post:{post.pk}', f'author:{post.author_id}']
+    if author_id is not None:
+        scopes.append(f'author:{author_id}')
+    for group in (post.group_id, group_id):
+        if group is not None:
+            scopes.append(f'group:{group}')
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def store_image_size(sender, instance, raw=False, **kwargs):
+    """Запоминает размеры новой картинки, читая только её заголовок."""
+    loaded = getattr(instance, '_loaded_values', {})
+    if raw or instance.image.name == loaded.get('image', ''):
+        return
+    instance.image_width = instance.image_height = None
+    if instance.image:
+        try:
+            instance.image_width, instance.image_height = (
+                get_image_dimensions(instance.image))
+        except (OSError, SuspiciousOperation):
+            # Файла нет в хранилище — размеры останутся пустыми.
+            pass
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    old_author_id = loaded.get('author_id', instance.author_id)
+    old_group_id = loaded.get('group_id', instance.group_id)
+    if created:
+        bump_stats(instance.author_id, posts_count=1)
+        feed.fan_out_post(instance)
+    elif old_author_id != instance.author_id:
+        with transaction.atomic():
+            bump_stats(old_author_id, posts_count=-1)
+            bump_stats(instance.author_id, posts_count=1)
+            feed.move_post(instance)
+    if instance.image and instance.image.name != loaded.get('image'):
+        thumbnails.pregenerate(instance.image.name, post_scopes(instance))
+    bump(*post_scopes(instance, old_author_id, old_group_id))
+    # Созданный в этом процессе пост тоже помнит сохранённые значения,
+    # иначе смена автора при следующем save() останется незамеченной.
+    instance._loaded_values = {
+        **loaded,
+        'author_id': instance.author_id,
+        'group_id': instance.group_id,
+        'image': instance.image.name,
+    }
+
+
+# id постов, которые удаляются в этом потоке. Их комментарии удаляются
+# каскадом раньше самого поста, и пересчитывать счётчики удаляемого поста
+# для каждого комментария незачем.
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    bump_stats(instance.author_id, posts_count=-1)
+    bump(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump('posts', 'groups', f'group:{instance.pk}')
+
+
+# Поля пользователя, которые выводят закэшированные фрагменты: имя и
+# ссылка на профиль.
+USER_RENDERED_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def rendered_user_values(user):
+    # __dict__, а не getattr: отложенное поле не должно грузиться.
+    return tuple(user.__dict__.get(name) for name in USER_RENDERED_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_user_values(sender, instance, **kwargs):
+    instance._rendered_values = rendered_user_values(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Сбрасывает кэш страниц с именем пользователя, если оно изменилось.
+
+    Пароль, last_login и права не выводятся, поэтому их сохранение кэш
+    не трогает. Главная и страницы групп зависят от области 'users'.
+    """
+    values = rendered_user_values(instance)
+    changed = values != getattr(instance, '_rendered_values', None)
+    instance._rendered_values = values
+    if raw or created or not changed:
+        return
+    bump('users', f'author:{instance.pk}')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump('posts', 'users', f'author:{instance.pk}')
+
+
+def comment_post_scopes(comment):
+    """
+    Области кэша поста комментария: страница поста, автора и группы.
+
+    Главная выводит счётчики комментариев, поэтому зависит ещё и от
+    области 'comments'; 'posts' остаётся версией самого списка постов.
+    """
+    if Comment.post.is_cached(comment):
+        post = comment.post
+    else:
+        post = Post.objects.filter(pk=comment.post_id).only(
+            'author_id', 'group_id').first()
+    if post is None:
+        return ['comments', f'post:{comment.post_id}']
+    scopes = ['comments', f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=F('comment_count') + 1,
+            last_comment_at=instance.created,
+        )
+    bump(*comment_post_scopes(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        # Области поста один раз увеличит post_deleted.
+        return
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1,
+        last_comment_at=last_comment_subquery(),
+    )
+    bump(*comment_post_scopes(instance))
+
+
+def follow_added(user_id, author_id):
+    """Счётчики, лента и кэш после новой подписки."""
+    with transaction.atomic():
+        bump_stats(author_id, followers_count=1)
+        bump_stats(user_id, following_count=1)
+        feed.backfill(user_id, author_id)
+    follow_graph.forget([user_id], [author_id])
+    bump(f'followers:{author_id}', f'following:{user_id}')
+
+
+def follow_removed(user_id, author_id):
+    """Счётчики, лента и кэш после отписки."""
+    with transaction.atomic():
+        bump_stats(author_id, followers_count=-1)
+        bump_stats(user_id, following_count=-1)
+        feed.trim(user_id, author_id)
+        feed.follower_left(author_id)
+    follow_graph.forget([user_id], [author_id])
+    bump(f'followers:{author_id}', f'following:{user_id}')
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follow_added(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    follow_removed(instance.user_id, instance.author_id)
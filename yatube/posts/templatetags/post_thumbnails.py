@@ -0,0 +1,33 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_pictures(posts, variant):
+    """
+    Проверяет миниатюры всех постов страницы одним пакетным запросом;
+    ставится перед циклом с {% post_picture %}.
+    """
+    thumbnails.prefetch_pictures(posts, variant)
+    return ''
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, variant, lazy=True):
+    """
+    Изображение поста тегом <picture> в варианте из
+    posts.thumbnails.VARIANTS.
+
+    Миниатюры строятся при сохранении поста, здесь только читаются;
+    размеры берутся из полей поста, файлы изображений не открываются.
+    """
+    if not post.image:
+        return {'picture': None}
+    picture = getattr(post, 'pictures', {}).get(variant)
+    if picture is None:
+        picture = thumbnails.get_picture(
+            post.image, variant, post.image_width, post.image_height)
+    return {'picture': picture, 'lazy': lazy}
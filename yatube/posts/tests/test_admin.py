@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Group, Post
+from ..utils import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+class AdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        User.objects.bulk_create(
+            User(username=f'user{number}') for number in range(20))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_posts(self, count):
+        groups = [self.group, None, Group.objects.create(
+            title='Ещё группа', slug=f'group-{Group.objects.count()}',
+            description='Описание')]
+        Post.objects.bulk_create(
+            Post(author=self.admin, group=groups[number % 3],
+                 text=f'Пост {number}')
+            for number in range(count)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=Post.objects.first(), author=self.admin,
+                    text='Комментарий')
+            for _ in range(count)
+        )
+
+    def changelist(self, model):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_changelist_without_exact_counts(self):
+        self.add_posts(3)
+        for model in ('post', 'comment'):
+            with self.subTest(model=model):
+                _, queries = self.changelist(model)
+                self.assertFalse([
+                    sql for sql in queries
+                    if 'COUNT(' in sql and f'posts_{model}' in sql
+                ])
+
+    def test_changelist_queries_do_not_grow(self):
+        self.add_posts(2)
+        # Первый запрос кладёт пользователя в кэш.
+        self.changelist('post')
+        counts = []
+        for model in ('post', 'comment'):
+            _, few = self.changelist(model)
+            self.add_posts(10)
+            _, many = self.changelist(model)
+            counts.append((model, len(few), len(many)))
+        for model, few, many in counts:
+            with self.subTest(model=model):
+                self.assertEqual(few, many)
+
+    def test_change_form_uses_autocomplete(self):
+        self.add_posts(1)
+        post = Post.objects.get()
+        response = self.client.get(
+            reverse('admin:posts_post_change', args=(post.pk,)))
+        content = response.content.decode()
+        self.assertIn('admin-autocomplete', content)
+        # В <select> только выбранный автор, а не все пользователи.
+        self.assertNotIn('user19', content)
+
+    def test_post_autocomplete_uses_search(self):
+        """Автокомплит поста в комментарии ищет по полнотекстовому индексу"""
+        self.add_posts(3)
+        response = self.client.get(
+            reverse('admin:posts_post_autocomplete'), {'term': 'Пост'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_date_filter_without_full_scan(self):
+        """Фильтр по дате не выбирает DISTINCT годы по всей таблице"""
+        self.add_posts(1)
+        for model, field in (('post', 'pub_date'), ('comment', 'created')):
+            with self.subTest(model=model):
+                _, queries = self.changelist(model)
+                self.assertFalse(
+                    [sql for sql in queries if 'DISTINCT' in sql])
+                response = self.client.get(
+                    reverse(f'admin:posts_{model}_changelist'),
+                    {f'{field}__gte': '2000-01-01',
+                     f'{field}__lt': '2000-01-02'},
+                )
+                self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {number}') for number in range(5))
+
+    @override_settings(ADMIN_COUNT_LIMIT=3)
+    def test_unfiltered_count_is_estimated(self):
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        last = Post.objects.latest('id').pk
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(paginator.count, last)
+        self.assertNotIn('COUNT', queries.captured_queries[0]['sql'])
+
+    def test_small_table_counted_exactly(self):
+        Post.objects.filter(pk__lt=Post.objects.latest('id').pk).delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        self.assertEqual(paginator.count, 1)
+
+    @override_settings(ADMIN_COUNT_LIMIT=3)
+    def test_filtered_count_is_limited(self):
+        posts = Post.objects.filter(text__startswith='Пост')
+        self.assertEqual(EstimatedCountPaginator(posts, 2).count, 3)
+        posts = Post.objects.filter(text='Пост 1')
+        self.assertEqual(EstimatedCountPaginator(posts, 2).count, 1)
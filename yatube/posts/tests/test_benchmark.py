@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from .. import benchmark
+from ..cache_versions import VERSION_KEY, get_version
+from ..models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+
+
+class PercentileTest(TestCase):
+    def test_interpolation(self):
+        values = [4, 1, 3, 2]
+        self.assertEqual(benchmark.percentile(values, 0), 1)
+        self.assertEqual(benchmark.percentile(values, 50), 2.5)
+        self.assertEqual(benchmark.percentile(values, 100), 4)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+    def test_compare(self):
+        previous = {'results': {'home': {'p95_ms': 10}, 'profile': {
+            'p95_ms': 10}}}
+        current = {'results': {'home': {'p95_ms': 10.5}, 'profile': {
+            'p95_ms': 12}, 'search': {'p95_ms': 50}}}
+        self.assertEqual(benchmark.compare(previous, current, 0.1),
+                         [('profile', 10, 12)])
+
+
+class SeedAndBenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_load', users=30, posts=200, groups=3, follows=5,
+            comments=300, batch_size=50, seed=1,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_seed_load(self):
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        self.assertGreater(Follow.objects.count(), 30)
+        # Самый популярный автор написал заметно больше среднего.
+        top = UserStats.objects.order_by('-posts_count').first()
+        self.assertGreater(top.posts_count, 200 / 30 * 3)
+        self.assertEqual(
+            sum(Post.objects.values_list('comment_count', flat=True)), 300)
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_benchmark_views(self):
+        path = os.path.join(self.directory, 'bench.json')
+        call_command(
+            'benchmark_views', iterations=3, warmup=1, output=path,
+            stdout=io.StringIO(),
+        )
+        with open(path, encoding='utf-8') as output:
+            report = json.load(output)
+        names = {pattern.name for pattern in benchmark.urls.urlpatterns}
+        self.assertEqual(set(report['results']), names)
+        for name, result in report['results'].items():
+            with self.subTest(name=name):
+                self.assertIn(result['status'], (200, 302))
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # Форма редактирования замеряется у автора поста, а не редирект.
+        self.assertEqual(report['results']['post_edit']['status'], 200)
+        # Каждый изменяющий запрос пишет в базу.
+        for name in ('add_comment', 'profile_follow', 'api_follow'):
+            self.assertGreater(report['results'][name]['queries'], 0)
+        # Форма нового поста отрисовывается без SQL (кэш сессии,
+        # пользователя и групп), остальные страницы читают базу.
+        self.assertEqual(report['results']['post_create']['queries'], 0)
+        self.assertGreater(report['results']['home']['queries'], 0)
+        self.assertEqual(report['meta']['rows']['posts'], 200)
+        # Изменяющие запросы откатываются.
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Post.objects.count(), 200)
+
+    def test_write_scenarios_keep_cache(self):
+        """Изменяющие запросы не трогают общий кэш и откатывают свой"""
+        cache.clear()
+        runner = benchmark.Benchmark(iterations=1, warmup=0)
+        scenario = next(
+            scenario for scenario in benchmark.build_scenarios(runner.objects)
+            if scenario.name == 'add_comment')
+        scope = f'post:{runner.objects["post"].pk}'
+        with override_settings(CACHES=benchmark.BENCHMARK_CACHES):
+            version = get_version(scope)
+            runner.request(scenario)
+            self.assertEqual(get_version(scope), version)
+        self.assertIsNone(cache.get(VERSION_KEY.format(scope)))
+
+    def test_compare_reports_regression(self):
+        path = os.path.join(self.directory, 'previous.json')
+        with open(path, 'w', encoding='utf-8') as previous:
+            json.dump({'results': {'home': {'p95_ms': 0.001}}}, previous)
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark_views', iterations=2, warmup=0, only=['home'],
+                compare=path, stdout=io.StringIO(), stderr=io.StringIO(),
+            )
@@ -0,0 +1,99 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import follow_graph
+from ..models import Follow, Post
+
+User = get_user_model()
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(4)
+        ]
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+        Follow.objects.create(user=cls.authors[0], author=cls.authors[1])
+        for author in cls.authors:
+            Post.objects.create(author=author, text=f'Пост {author}')
+
+    def setUp(self):
+        cache.clear()
+        self.ids = [author.pk for author in self.authors]
+
+    def test_is_following(self):
+        """Подписки на всех авторов проверяются одним запросом"""
+        with self.assertNumQueries(1):
+            following = follow_graph.is_following(self.reader, self.ids)
+        self.assertEqual(following, {
+            self.ids[0]: True, self.ids[1]: True,
+            self.ids[2]: False, self.ids[3]: False,
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                follow_graph.is_following(self.reader, self.ids), following)
+
+    def test_anonymous(self):
+        with self.assertNumQueries(0):
+            following = follow_graph.is_following(AnonymousUser(), self.ids)
+        self.assertEqual(following, dict.fromkeys(self.ids, False))
+
+    def test_following_ids_are_compact(self):
+        ids = follow_graph.following_ids(self.reader.pk)
+        self.assertEqual(ids.typecode, 'I')
+        self.assertEqual(list(ids), sorted(self.ids[:2]))
+        self.assertEqual(
+            len(cache.get(follow_graph.FOLLOWING_KEY.format(self.reader.pk))),
+            2 * ids.itemsize,
+        )
+
+    def test_followers_count(self):
+        """Счётчики читаются одним запросом, затем из кэша"""
+        with self.assertNumQueries(1):
+            counts = follow_graph.followers_count(self.ids)
+        self.assertEqual(counts, dict(zip(self.ids, (1, 2, 0, 0))))
+        with self.assertNumQueries(0):
+            self.assertEqual(follow_graph.followers_count(self.ids), counts)
+
+    def test_follow_and_unfollow_keep_cache_coherent(self):
+        follow_graph.is_following(self.reader, self.ids)
+        follow_graph.followers_count(self.ids)
+        self.client.force_login(self.reader)
+        self.client.get(reverse(
+            'posts:profile_follow', args=[self.authors[2].username]))
+        self.assertTrue(
+            follow_graph.is_following(self.reader, self.ids)[self.ids[2]])
+        self.assertEqual(
+            follow_graph.followers_count(self.ids)[self.ids[2]], 1)
+        self.client.get(reverse(
+            'posts:profile_unfollow', args=[self.authors[0].username]))
+        self.assertFalse(
+            follow_graph.is_following(self.reader, self.ids)[self.ids[0]])
+        self.assertEqual(
+            follow_graph.followers_count(self.ids)[self.ids[0]], 0)
+
+    def test_listing_shows_follow_state_without_queries_per_author(self):
+        """Кнопки подписки на странице поиска не добавляют запросов"""
+        self.client.force_login(self.reader)
+        url = reverse('posts:search')
+        self.client.get(url, {'q': 'Пост'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'q': 'Пост'})
+        self.assertEqual(
+            [query['sql'] for query in queries
+             if 'posts_follow' in query['sql']
+             or 'posts_userstats' in query['sql']],
+            [],
+        )
+        self.assertContains(response, 'Отписаться', count=2)
+        self.assertContains(response, 'Подписаться', count=2)
+        self.assertContains(response, 'Подписчиков: 2')
@@ -1,20 +1,26 @@
+import shutil
 import tempfile
 
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.conf import settings
+from django.forms import ModelChoiceField
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from .. import lookups
+from ..forms import PostForm
 from ..models import Group, Post, Comment
 
 User = get_user_model()
 
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class CreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -40,6 +46,11 @@ class CreateFormTests(TestCase):
             b'\x0A\x00\x3B'
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         """Создание клиента авторизованного"""
         self.authorized_client = Client()
@@ -139,3 +150,69 @@ class CreateFormTests(TestCase):
         post_create_image = Post.objects.order_by('-id')[0]
         self.assertEqual(post_create_image.text, form_data['text'])
         self.assertTrue(post_create_image.image)
+
+
+class GroupChoicesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Первая группа', slug='first', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def group_queries(self, url, data=None):
+        """Запросы к таблице групп при отрисовке формы по адресу url"""
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            if data is None:
+                response = self.client.get(url)
+            else:
+                response = self.client.post(url, data)
+        self.assertContains(response, self.group.title)
+        return [query['sql'] for query in queries
+                if 'posts_group' in query['sql']]
+
+    def test_create_and_edit_without_choice_queries(self):
+        """Список групп в форме берётся из кэша"""
+        for url in (reverse('posts:post_create'),
+                    reverse('posts:post_edit', args=[self.post.pk])):
+            with self.subTest(url=url):
+                self.assertEqual(self.group_queries(url), [])
+
+    def test_invalid_form_rerendered_without_choice_queries(self):
+        """Повторная отрисовка формы с ошибками не читает группы"""
+        self.assertEqual(self.group_queries(
+            reverse('posts:post_create'), {'text': ''}), [])
+
+    def test_group_changes_reset_choices(self):
+        """Изменение и удаление группы сразу видны в форме"""
+        url = reverse('posts:post_create')
+        self.client.get(url)
+        other = Group.objects.create(
+            title='Вторая группа', slug='second', description='Описание')
+        self.assertContains(self.client.get(url), other.title)
+        other.title = 'Переименованная группа'
+        other.save()
+        self.assertContains(self.client.get(url), other.title)
+        other.delete()
+        self.assertNotContains(self.client.get(url), other.title)
+
+    def test_process_memo(self):
+        """Пока версия не изменилась, список групп не читается из кэша"""
+        lookups.groups.all()
+        cache.delete(lookups.LOOKUP_KEY.format(
+            'groups', lookups.get_version('groups')))
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.groups.all(), [self.group])
+
+    def test_field_stays_model_choice_field(self):
+        """Выбранная группа по-прежнему проверяется по базе"""
+        form = PostForm(data={'text': 'Текст', 'group': 0})
+        self.assertIs(type(form.fields['group']), ModelChoiceField)
+        self.assertFalse(form.is_valid())
+        self.assertIn('group', form.errors)
@@ -1,7 +1,12 @@
+import io
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -43,3 +48,77 @@ class PostModelTest(TestCase):
         group1 = PostModelTest.group
         object_name = group1.title
         self.assertEqual(object_name, str(group1))
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count,
+             stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении постов и подписок"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Ещё пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, 2, 1, 0)
+        self.assertStats(self.reader, 0, 0, 1)
+        post.delete()
+        follow.delete()
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.reader, 0, 0, 0)
+
+    def test_counters_author_change(self):
+        """Смена автора поста переносит счётчик"""
+        Post.objects.create(author=self.author, text='Пост')
+        post = Post.objects.get()
+        post.author = self.reader
+        post.save()
+        post.save()
+        self.assertStats(self.author, 0, 0, 0)
+        self.assertStats(self.reader, 1, 0, 0)
+
+    def test_counters_in_write_transaction(self):
+        """Запись откатывается, если счётчик обновить не удалось"""
+        with mock.patch(
+                'posts.signals.bump_stats', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Post.objects.create(author=self.author, text='Пост')
+            with self.assertRaises(DatabaseError):
+                Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertStats(self.author, 0, 0, 0)
+
+    def test_counters_user_delete(self):
+        """Удаление пользователя обновляет счётчики остальных"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        User.objects.get(pk=self.reader.pk).delete()
+        self.assertStats(self.author, 0, 0, 0)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters пересчитывает счётчики с нуля"""
+        Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(
+            posts_count=100, followers_count=100, following_count=100)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.assertStats(self.author, 1, 1, 0)
+        self.assertStats(self.reader, 0, 0, 1)
+
+    def test_missing_stats_recounted(self):
+        """Отсутствующая строка счётчиков считается при чтении"""
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).delete()
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(UserStats.objects.for_user(author).posts_count, 1)
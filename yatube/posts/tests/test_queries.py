@@ -0,0 +1,119 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from .utils import query_budget
+
+User = get_user_model()
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов страниц не растёт вместе с данными."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='TESTSLUG',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def add_posts(self, count):
+        """Посты разных групп с комментариями разных авторов."""
+        for number in range(count):
+            group = Group.objects.create(
+                title=f'Группа {number}',
+                slug=f'group-{Group.objects.count()}',
+                description='Описание',
+            )
+            post = Post.objects.create(
+                author=self.author, group=group, text=f'Пост {number}')
+            commentator = User.objects.create_user(
+                username=f'user{User.objects.count()}')
+            Comment.objects.create(
+                post=post, author=commentator, text='Комментарий')
+        return Post.objects.filter(author=self.author).first()
+
+    def get_budgets(self, post):
+        """Адрес, клиент и бюджет запросов для каждой страницы."""
+        return (
+            (reverse('posts:home'), self.reader_client, 3),
+            (reverse('posts:home') + '?page=1', self.reader_client, 4),
+            (reverse('posts:group_posts', args=(self.group.slug,)),
+             self.reader_client, 5),
+            (reverse('posts:profile', args=(self.author.username,)),
+             self.reader_client, 6),
+            (reverse('posts:post_detail', args=(post.pk,)),
+             self.reader_client, 5),
+            (reverse('posts:post_comments', args=(post.pk,)),
+             self.reader_client, 4),
+            # С пустым кэшем лента читает ещё подписки и счётчики
+            # подписчиков (posts.follow_graph) — по запросу на страницу.
+            (reverse('posts:follow_index'), self.reader_client, 6),
+            (reverse('posts:post_edit', args=(post.pk,)),
+             self.author_client, 4),
+            (reverse('posts:post_create'), self.author_client, 4),
+        )
+
+    def test_views_stay_within_budget(self):
+        """Страницы укладываются в бюджет при малом и большом объёме"""
+        for count in (2, 12):
+            post = self.add_posts(count)
+            Comment.objects.bulk_create(
+                Comment(post=post, author=self.reader, text='Ещё')
+                for _ in range(count)
+            )
+            for url, client, budget in self.get_budgets(post):
+                with self.subTest(url=url, posts=count):
+                    cache.clear()
+                    with query_budget(budget):
+                        response = client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_listings_query_count_is_constant(self):
+        """Счётчики комментариев на списках не добавляют запросов на пост"""
+        listings = (
+            (reverse('posts:home'), self.reader_client),
+            (reverse('posts:group_posts', args=(self.group.slug,)),
+             self.reader_client),
+            (reverse('posts:profile', args=(self.author.username,)),
+             self.reader_client),
+            (reverse('posts:follow_index'), self.reader_client),
+        )
+        counts = {}
+        for total in (2, 12):
+            self.add_posts(total - Post.objects.count())
+            post = Post.objects.filter(author=self.author).first()
+            post.group = self.group
+            post.save()
+            for url, client in listings:
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                self.assertContains(response, 'Комментариев: 1')
+                counts.setdefault(url, []).append(len(queries))
+        for url, (few, many) in counts.items():
+            with self.subTest(url=url):
+                self.assertEqual(few, many)
+
+    def test_budget_violation_is_reported(self):
+        """query_budget падает, если запросов больше бюджета"""
+        with self.assertRaises(AssertionError):
+            with query_budget(1):
+                User.objects.count()
+                User.objects.count()
@@ -0,0 +1,93 @@
+import re
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Comment, FeedEntry, Follow, Group, Post
+from ..utils import KeysetPaginator
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Планы проверяются для SQLite')
+class QueryPlanTest(TestCase):
+    """Горячие запросы читают индексы, а не всю таблицу."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='TESTSLUG',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}')
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text='Комментарий')
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queries):
+        """Ни один запрос не читает таблицу целиком и не сортирует."""
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            plan = self.get_plan(query['sql'])
+            with self.subTest(sql=query['sql'], plan=plan):
+                for step in plan:
+                    self.assertNotIn('TEMP B-TREE', step)
+                    self.assertIsNone(FULL_SCAN.match(step))
+
+    def walk_pages(self, queryset, **kwargs):
+        """Первая, следующая и предыдущая страницы курсорной пагинации."""
+        paginator = KeysetPaginator(queryset, 5, **kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            first = paginator.get_page()
+            second = paginator.get_page(first.next_cursor)
+            third = paginator.get_page(second.next_cursor)
+            paginator.get_page(third.previous_cursor)
+        return queries
+
+    def test_feed_pages(self):
+        """Главная, группа и профиль читаются по составным индексам"""
+        querysets = (
+            Post.objects.all(),
+            Post.objects.filter(group=self.group),
+            Post.objects.filter(author=self.author),
+        )
+        for queryset in querysets:
+            self.assertIndexed(self.walk_pages(queryset))
+
+    def test_follow_feed_pages(self):
+        """Лента подписок читается по индексу читателя"""
+        queries = self.walk_pages(
+            FeedEntry.objects.filter(user=self.reader),
+            keys=('pub_date', 'post_id'),
+        )
+        self.assertIndexed(queries)
+
+    def test_comments(self):
+        """Комментарии поста читаются по индексу (post, created)"""
+        with CaptureQueriesContext(connection) as queries:
+            list(self.post.comments.all())
+        self.assertIndexed(queries)
+
+    def test_follow_lookups(self):
+        """Проверка подписки и выборка подписчиков используют индексы"""
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.filter(
+                user=self.reader, author=self.author).exists()
+            list(Follow.objects.filter(
+                author=self.author).values_list('user_id', flat=True))
+        self.assertIndexed(queries)
@@ -0,0 +1,141 @@
+import io
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post
+from ..search import build_match, filter_posts, search_posts
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='writer')
+        cls.other = User.objects.create(username='other')
+        cls.group = Group.objects.create(
+            title='Путешествия',
+            slug='travel',
+            description='Тестовое описание',
+        )
+        cls.rare = Post.objects.create(
+            author=cls.author,
+            text='Горы и море, и немного про горы.',
+        )
+        cls.dense = Post.objects.create(
+            author=cls.author,
+            group=cls.group,
+            text='Горы горы горы',
+        )
+        cls.foreign = Post.objects.create(
+            author=cls.other,
+            group=cls.group,
+            text='Горы в другом посте',
+        )
+        cls.unrelated = Post.objects.create(
+            author=cls.other,
+            text='Совсем другая тема',
+        )
+
+    def search(self, query, **kwargs):
+        return list(search_posts(query, **kwargs)[:10])
+
+    def test_build_match_quotes_terms(self):
+        """Операторы FTS5 во вводе не интерпретируются."""
+        self.assertEqual(build_match('Горы OR "море*'), '"горы" "or" "море"')
+        self.assertEqual(build_match(' ,.! '), '')
+
+    def test_results_ranked_by_relevance(self):
+        """Пост с наибольшей плотностью слова выше в выдаче."""
+        results = self.search('горы')
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], self.dense)
+        self.assertNotIn(self.unrelated, results)
+
+    def test_all_terms_required(self):
+        self.assertEqual(self.search('горы море'), [self.rare])
+
+    def test_filters(self):
+        self.assertEqual(
+            set(self.search('горы', author_id=self.author.pk)),
+            {self.rare, self.dense},
+        )
+        self.assertEqual(
+            set(self.search('горы', group_id=self.group.pk)),
+            {self.dense, self.foreign},
+        )
+
+    def test_count(self):
+        self.assertEqual(search_posts('горы').count(), 3)
+        self.assertEqual(search_posts('').count(), 0)
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_results_capped(self):
+        """Подсчёт и срезы не выходят за SEARCH_MAX_RESULTS"""
+        results = search_posts('горы')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(len(results[0:10]), 2)
+        self.assertEqual(results[2:10], [])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = Post.objects.get(pk=self.unrelated.pk)
+        post.text = 'Теперь про закаты'
+        post.save()
+        self.assertEqual(self.search('закаты'), [post])
+        self.assertEqual(self.search('тема'), [])
+        post.delete()
+        self.assertEqual(self.search('закаты'), [])
+
+    def test_search_view(self):
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'горы', 'group': 'travel'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.context['page_obj']), {self.dense, self.foreign})
+        self.assertEqual(
+            response.context['page_query'], 'q=%D0%B3%D0%BE%D1%80%D1%8B&'
+            'group=travel&')
+
+    def test_search_tab_active(self):
+        """Вкладка «Поиск» в шапке отмечена только на странице поиска"""
+        active = re.compile(
+            r'class="nav-link active"\s+href="{}"'.format(
+                reverse('posts:search')))
+        response = self.client.get(reverse('posts:search'))
+        self.assertRegex(response.content.decode(), active)
+        response = self.client.get(reverse('posts:home'))
+        self.assertNotRegex(response.content.decode(), active)
+
+    def test_search_view_unknown_group(self):
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'горы', 'group': 'missing'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'море'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.rare])
+
+    def test_filter_posts_returns_all_matches(self):
+        posts = filter_posts(Post.objects.all(), 'горы')
+        self.assertCountEqual(
+            posts, [self.rare, self.dense, self.foreign])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) "
+                "VALUES ('delete-all')")
+        self.assertEqual(self.search('горы'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(len(self.search('горы')), 3)
@@ -0,0 +1,203 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from sorl.thumbnail import default
+
+from .. import thumbnails
+from ..cache_versions import get_version
+from ..models import Post
+from .utils import run_on_commit
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(name='photo.png', size=(120, 80)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, post, variant='feed'):
+        template = Template(
+            '{% load post_thumbnails %}{% post_picture post variant %}')
+        return template.render(Context({'post': post, 'variant': variant}))
+
+    def create_post(self, size=(2000, 1000)):
+        with run_on_commit():
+            return Post.objects.create(
+                author=self.user, text='Пост', image=make_image(size=size))
+
+    def test_image_size_stored(self):
+        post = self.create_post()
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2000, 1000))
+        post.image = ''
+        post.save()
+        self.assertIsNone(post.image_width)
+
+    def test_variants_built_on_save(self):
+        """Все ширины и форматы готовы сразу после сохранения поста."""
+        post = self.create_post()
+        for variant in thumbnails.VARIANTS:
+            with self.subTest(variant=variant):
+                built = thumbnails.backend.get_prebuilt(
+                    post.image, variant, post.image_width)
+                self.assertEqual(set(built), set(thumbnails.FORMATS))
+                widths = [width for _, width in built['JPEG']]
+                self.assertEqual(widths, [
+                    width for width, _ in thumbnails.variant_sizes(variant)])
+
+    def test_sizes_limited_by_source(self):
+        """Миниатюры шире исходника не строятся, кроме самой узкой."""
+        self.assertEqual(
+            thumbnails.variant_sizes('feed', 1000), [(450, 150), (900, 300)])
+        self.assertEqual(thumbnails.variant_sizes('feed', 100), [(450, 150)])
+        post = self.create_post(size=(120, 80))
+        built = thumbnails.backend.get_prebuilt(
+            post.image, 'feed', post.image_width)
+        self.assertEqual([width for _, width in built['JPEG']], [450])
+
+    def test_picture_markup(self):
+        post = self.create_post()
+        html = self.render(post)
+        built = thumbnails.backend.get_prebuilt(
+            post.image, 'feed', post.image_width)
+        self.assertIn('<picture>', html)
+        self.assertIn(f'src="{built["JPEG"][1][0]}"', html)
+        self.assertIn(thumbnails.srcset(built['JPEG']), html)
+        self.assertIn('width="900" height="300"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn(thumbnails.VARIANTS['feed'].sizes, html)
+        if 'WEBP' in thumbnails.FORMATS:
+            self.assertIn('type="image/webp"', html)
+
+    def test_template_does_not_generate(self):
+        """Без готовых миниатюр тег отдаёт оригинал и ничего не строит."""
+        post = self.create_post()
+        default.kvstore.clear()
+        cache.clear()
+        with mock.patch.object(
+                thumbnails.backend, 'render') as render, mock.patch(
+                'django.core.files.storage.FileSystemStorage.open') as open_:
+            html = self.render(Post.objects.get(pk=post.pk))
+        render.assert_not_called()
+        open_.assert_not_called()
+        self.assertIn(f'src="{post.image.url}"', html)
+        self.assertIn('width="2000" height="1000"', html)
+        self.assertNotIn('srcset', html)
+
+    def test_unchanged_image_not_rebuilt(self):
+        post = Post.objects.get(pk=self.create_post().pk)
+        default.kvstore.clear()
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(
+            thumbnails.backend.get_prebuilt(post.image, 'feed'), {})
+        post.image = make_image('other.png')
+        with run_on_commit():
+            post.save()
+        self.assertTrue(thumbnails.backend.get_prebuilt(post.image, 'feed'))
+
+    def test_built_after_commit(self):
+        """Миниатюры строятся только после фиксации транзакции."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image())
+        self.assertEqual(
+            thumbnails.backend.get_prebuilt(post.image, 'feed'), {})
+
+    def test_build_bumps_post_scopes(self):
+        """Готовые миниатюры сбрасывают кэш страниц с постом."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image())
+        scopes = ('posts', f'post:{post.pk}', f'author:{self.user.pk}')
+        before = get_version(*scopes)
+        thumbnails.build(post.image.name, scopes)
+        self.assertNotEqual(get_version(*scopes), before)
+
+    def test_page_prefetched_in_one_batch(self):
+        """Миниатюры страницы читаются из кэша одним get_many."""
+        posts = [self.create_post(size=(400, 200)) for _ in range(3)]
+        Post.objects.create(author=self.user, text='Без картинки')
+        expected = {
+            post.pk: thumbnails.get_picture(
+                post.image, 'feed', post.image_width, post.image_height)
+            for post in posts
+        }
+        cache.clear()
+        posts = list(Post.objects.all())
+        with mock.patch.object(
+                default.kvstore.cache, 'get_many',
+                wraps=default.kvstore.cache.get_many) as get_many, \
+                mock.patch.object(default.kvstore, 'get') as get:
+            with CaptureQueriesContext(connection) as queries:
+                thumbnails.prefetch_pictures(posts, 'feed')
+        get_many.assert_called_once()
+        get.assert_not_called()
+        self.assertEqual(len(queries), 1)
+        for post in posts:
+            if post.image:
+                self.assertEqual(post.pictures['feed'], expected[post.pk])
+        # Промахи записаны в кэш: повторная проверка обходится без базы.
+        with self.assertNumQueries(0):
+            thumbnails.prefetch_pictures(posts, 'feed')
+
+    def test_prefetched_pictures_used_by_tag(self):
+        post = self.create_post()
+        post = Post.objects.get(pk=post.pk)
+        thumbnails.prefetch_pictures([post], 'feed')
+        with mock.patch.object(thumbnails, 'get_picture') as get_picture:
+            html = self.render(post)
+        get_picture.assert_not_called()
+        self.assertIn(post.pictures['feed']['srcset'], html)
+
+    def test_post_without_image(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        self.assertEqual(self.render(post).strip(), '')
+
+    def test_rebuild_command(self):
+        post = self.create_post(size=(400, 200))
+        default.kvstore.clear()
+        call_command('rebuild_thumbnails', stdout=io.StringIO())
+        self.assertTrue(thumbnails.backend.get_prebuilt(post.image, 'feed'))
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_worker_pool_renders_files(self):
+        name = default.storage.save('posts/pool.png', make_image())
+        try:
+            future = thumbnails.get_executor().submit(
+                thumbnails._render, name)
+            source_size, built = future.result(timeout=60)
+        finally:
+            thumbnails.shutdown_executor()
+        self.assertEqual(source_size, [120, 80])
+        self.assertEqual(
+            len(built), len(thumbnails.VARIANTS) * len(thumbnails.FORMATS))
+        for thumbnail_name, size in built:
+            self.assertTrue(default.storage.exists(thumbnail_name))
@@ -0,0 +1,194 @@
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import transfer
+from ..cache_versions import get_version
+from ..models import Comment, FeedEntry, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.date = timezone.now() - datetime.timedelta(days=30)
+        for number in range(5):
+            post = Post.objects.create(
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+                text=f'Пост {number}',
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'Комментарий {number}')
+        Post.objects.update(pub_date=cls.date)
+        Comment.objects.update(created=cls.date)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self, format_='jsonl'):
+        path = os.path.join(self.directory, f'dump.{format_}')
+        stderr = io.StringIO()
+        call_command('export_posts', output=path, format=format_,
+                     chunk_size=2, stderr=stderr)
+        self.assertIn('Выгружено записей: 12', stderr.getvalue())
+        return path
+
+    def wipe(self):
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        Follow.objects.all().delete()
+        User.objects.filter(username='reader').delete()
+
+    def import_(self, path, **options):
+        stderr = io.StringIO()
+        call_command(
+            'import_posts', path, batch_size=2, stdout=io.StringIO(),
+            stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def assert_restored(self):
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            [f'Пост {number}' for number in range(5)])
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(
+            Post.objects.filter(group__slug='group').count(), 2)
+        self.assertFalse(Post.objects.exclude(pub_date=self.date).exists())
+        self.assertFalse(
+            Comment.objects.exclude(created=self.date).exists())
+        reader = User.objects.get(username='reader')
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=self.author).exists())
+        # Счётчики и ленты пересобраны после импорта.
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 5)
+        self.assertEqual(
+            UserStats.objects.get(user=reader).following_count, 1)
+        self.assertEqual(set(Post.objects.values_list(
+            'comment_count', flat=True)), {1})
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 5)
+
+    def test_jsonl_round_trip(self):
+        path = self.export()
+        with open(path, encoding='utf-8') as dump:
+            models = [json.loads(line)['model'] for line in dump]
+        self.assertEqual(
+            models, ['group'] + ['post'] * 5 + ['comment'] * 5 + ['follow'])
+        ids = set(Post.objects.values_list('pk', flat=True))
+        self.wipe()
+        output = self.import_(path)
+        self.assert_restored()
+        self.assertEqual(set(Post.objects.values_list('pk', flat=True)), ids)
+        self.assertIn('в секунду', output)
+
+    def test_csv_round_trip(self):
+        path = self.export('csv')
+        self.wipe()
+        self.import_(path)
+        self.assert_restored()
+
+    def test_import_is_idempotent(self):
+        path = self.export()
+        self.import_(path)
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_id_collision_fails(self):
+        """Занятый другой записью id останавливает импорт"""
+        path = self.export()
+        with open(path, encoding='utf-8') as dump:
+            records = [json.loads(line) for line in dump]
+        post_id = next(
+            record['id'] for record in records if record['model'] == 'post')
+        self.wipe()
+        Post.objects.create(id=post_id, author=self.author, text='Чужой пост')
+        with self.assertRaisesMessage(CommandError, 'уже есть в базе'):
+            self.import_(path)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Чужой пост'])
+
+    def test_finish_rebuilds_only_touched_users(self):
+        """Счётчики и ленты посторонних пользователей не пересчитываются"""
+        path = self.export()
+        self.wipe()
+        bystander = User.objects.create_user(username='bystander')
+        UserStats.objects.filter(user=bystander).update(posts_count=7)
+        self.import_(path)
+        self.assert_restored()
+        self.assertEqual(
+            UserStats.objects.get(user=bystander).posts_count, 7)
+
+    @override_settings(IMPORT_TRACK_LIMIT=3)
+    def test_track_limit_rebuilds_everything(self):
+        """Сверх IMPORT_TRACK_LIMIT затронутое не копится в памяти"""
+        path = self.export()
+        self.wipe()
+        bystander = User.objects.create_user(username='bystander')
+        UserStats.objects.filter(user=bystander).update(posts_count=7)
+        versions = [get_version(scope) for scope in transfer.COARSE_SCOPES]
+        importer = transfer.Importer(batch_size=2)
+        sizes = []
+        original = importer.limit_tracked
+
+        def limit_tracked():
+            original()
+            sizes.append(sum(
+                len(getattr(importer, name)) for name in importer.TRACKED))
+
+        importer.limit_tracked = limit_tracked
+        with open(path, encoding='utf-8') as stream:
+            importer.run(transfer.read_records(stream, 'jsonl'))
+        self.assertTrue(importer.overflowed)
+        self.assertLessEqual(max(sizes), 3)
+        self.assert_restored()
+        self.assertEqual(
+            UserStats.objects.get(user=bystander).posts_count, 0)
+        for scope, version in zip(transfer.COARSE_SCOPES, versions):
+            with self.subTest(scope=scope):
+                self.assertNotEqual(get_version(scope), version)
+
+    def test_resume_from_checkpoint(self):
+        """Прерванный импорт продолжается с последней записанной пачки"""
+        path = self.export()
+        checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        self.wipe()
+        original = transfer.Importer.insert_comments
+        calls = []
+
+        def fail_second_batch(importer, records):
+            calls.append(records)
+            if len(calls) > 1:
+                raise RuntimeError('Сбой при импорте')
+            return original(importer, records)
+
+        with mock.patch.object(
+                transfer.Importer, 'insert_comments', fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_(path, checkpoint=checkpoint)
+        with open(checkpoint) as state:
+            done = json.load(state)['records']
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertGreater(done, 0)
+        self.import_(path, checkpoint=checkpoint)
+        self.assert_restored()
+        self.assertFalse(os.path.exists(checkpoint))
@@ -0,0 +1,128 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import (SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..forms import PostForm
+from ..models import Post
+from ..uploads import CONTENT_TYPES, process_upload
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+# Тег EXIF Orientation: 6 — повернуть на 90° по часовой стрелке.
+ORIENTATION = 0x0112
+
+
+def make_jpeg(size=(40, 20), orientation=None, name='photo.jpg',
+              format_='JPEG'):
+    image = Image.new('RGB', size, 'green')
+    params = {}
+    if orientation:
+        exif = image.getexif()
+        exif[ORIENTATION] = orientation
+        params['exif'] = exif.tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, format_, **params)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), CONTENT_TYPES[format_])
+
+
+def open_upload(upload):
+    upload.seek(0)
+    return Image.open(io.BytesIO(upload.read()))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class UploadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def form(self, upload):
+        return PostForm({'text': 'Пост'}, {'image': upload})
+
+    def test_small_image_kept(self):
+        """Картинка без EXIF в пределах лимитов не перекодируется."""
+        upload = make_jpeg()
+        self.assertIs(process_upload(upload), upload)
+
+    def test_exif_stripped_and_applied(self):
+        with self.assertLogs('posts.uploads', 'INFO') as logs:
+            result = process_upload(make_jpeg(orientation=6))
+        image = open_upload(result)
+        self.assertNotIn('exif', image.info)
+        self.assertEqual(image.size, (20, 40))
+        self.assertIn('пиковый RSS', logs.output[0])
+
+    def test_png_exif_stripped(self):
+        """PNG с блоком eXIf тоже сохраняется без EXIF."""
+        result = process_upload(make_jpeg(
+            orientation=6, name='photo.png', format_='PNG'))
+        image = open_upload(result)
+        self.assertEqual(image.format, 'PNG')
+        self.assertNotIn('exif', image.info)
+        self.assertEqual(image.size, (20, 40))
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIDE=100)
+    def test_large_image_downscaled(self):
+        result = process_upload(make_jpeg(size=(400, 200)))
+        image = open_upload(result)
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (100, 50))
+        self.assertEqual(result.name, 'photo.jpg')
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIDE=100)
+    def test_temporary_file_upload(self):
+        """Файлы, записанные Django на диск, читаются по пути."""
+        source = make_jpeg(size=(400, 200))
+        upload = TemporaryUploadedFile('photo.jpg', 'image/jpeg', 0, None)
+        upload.write(source.read())
+        upload.size = upload.tell()
+        upload.seek(0)
+        result = process_upload(upload)
+        self.assertEqual(open_upload(result).size, (100, 50))
+
+    @override_settings(UPLOAD_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        form = self.form(make_jpeg())
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'too_many_pixels')
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIZE=10)
+    def test_large_file_rejected(self):
+        form = self.form(make_jpeg())
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'file_too_large')
+
+    @override_settings(UPLOAD_IMAGE_FORMATS=('PNG',))
+    def test_format_checked_by_header(self):
+        form = self.form(make_jpeg(name='photo.png'))
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'invalid_format')
+
+    def test_create_post_strips_exif(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': make_jpeg(orientation=6),
+        })
+        post = Post.objects.get(text='Пост с картинкой')
+        with Image.open(post.image.path) as image:
+            self.assertNotIn('exif', image.info)
+            self.assertEqual(image.size, (20, 40))
+        self.assertEqual((post.image_width, post.image_height), (20, 40))
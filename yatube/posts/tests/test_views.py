@@ -1,11 +1,20 @@
 from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
-from ..models import Group, Post, Follow
+from .. import follows
+from ..cache_versions import get_version
+from ..models import Comment, FeedEntry, Group, Post, Follow, UserStats
+from ..signals import deleting_posts
+from ..utils import (
+    CURSOR_NEXT, CURSOR_PREVIOUS, KeysetPaginator, WindowedPaginator,
+    encode_cursor,
+)
 
 User = get_user_model()
 
@@ -59,6 +68,96 @@ class PaginatorViewsTest(TestCase):
                 response = self.client.get(reverse_name)
                 self.assertEqual(len(response.context['page_obj']), template)
 
+    @override_settings(PAGES=1, PAGINATOR_ON_EACH_SIDE=2,
+                       PAGINATOR_ON_ENDS=1)
+    def test_page_window(self):
+        """Номера страниц выводятся окном с многоточиями"""
+        response = self.client.get(reverse('posts:home') + '?page=7')
+        ellipsis = WindowedPaginator.ELLIPSIS
+        self.assertEqual(
+            response.context['page_obj'].page_window,
+            [1, ellipsis, 5, 6, 7, 8, 9, ellipsis, 13]
+        )
+        self.assertNotContains(response, '?page=3"')
+
+    def test_page_window_is_bounded(self):
+        """Размер окна не зависит от числа страниц"""
+        paginator = WindowedPaginator(
+            range(10 ** 7), 10, on_each_side=3, on_ends=2)
+        for number in (1, 4, 500000, paginator.num_pages):
+            with self.subTest(number=number):
+                window = paginator.get_page_window(number)
+                self.assertIn(number, window)
+                self.assertLessEqual(len(window), 2 * 2 + 2 * 3 + 3)
+
+    def test_keyset_paginator_cursors(self):
+        """Курсоры ведут на следующую и обратно на первую страницу"""
+        url = reverse('posts:group_posts', kwargs={'slug': self.group.slug})
+        first_page = self.client.get(url).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        self.assertIsNotNone(first_page.next_cursor)
+        second_page = self.client.get(
+            url, {'cursor': first_page.next_cursor}).context['page_obj']
+        self.assertEqual(
+            len(second_page), Post.objects.count() - settings.PAGES)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertEqual(
+            set(first_page) & set(second_page), set())
+        back_page = self.client.get(
+            url, {'cursor': second_page.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertIsNone(back_page.previous_cursor)
+
+    def test_keyset_paginator_without_count(self):
+        """Курсорная страница не выполняет COUNT(*)"""
+        url = reverse('posts:group_posts', kwargs={'slug': self.group.slug})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries))
+
+    def test_keyset_paginator_bad_cursor(self):
+        """Испорченный курсор возвращает первую страницу"""
+        response = self.client.get(
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            {'cursor': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), settings.PAGES)
+
+    def test_keyset_paginator_null_cursor(self):
+        """Курсор с null в ключе возвращает первую страницу, а не 500"""
+        post = Post.objects.filter(group=self.group).first()
+        urls = (
+            reverse('posts:home'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts:profile', kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+        )
+        for direction in (CURSOR_NEXT, CURSOR_PREVIOUS):
+            cursor = encode_cursor(direction, [None, None])
+            for url in urls:
+                with self.subTest(url=url, direction=direction):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+
+    def test_keyset_page_number(self):
+        """Номер есть только у первой страницы, соседи — по курсорам"""
+        paginator = KeysetPaginator(
+            Post.objects.filter(group=self.group), settings.PAGES)
+        first_page = paginator.get_page()
+        self.assertEqual(first_page.number, 1)
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+        second_page = paginator.get_page(first_page.next_cursor)
+        self.assertIsNone(second_page.number)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        null_page = paginator.get_page(
+            encode_cursor(CURSOR_NEXT, [None, None]))
+        self.assertEqual(list(null_page), list(first_page))
+
 
 class PostViewTest(TestCase):
     @classmethod
@@ -181,20 +280,151 @@ class CashTest(TestCase):
         )
 
     def test_cache_home(self):
-        """Проверяем работу кэша главной страницы"""
+        """Главная страница кэшируется до изменения данных"""
         cache.clear()
-        response = self.client.get(reverse('posts:home'))
-        posts_text = response.content
-        Post.objects.create(
+        self.client.get(reverse('posts:home'))
+        post = Post.objects.create(
             text='New text after cashe',
             author=self.author,
             group=self.group
         )
         response = self.client.get(reverse('posts:home'))
-        self.assertEqual(response.content, posts_text)
-        cache.clear()
+        self.assertContains(response, post.text)
+        Post.objects.filter(pk=post.pk).update(text='Changed quietly')
+        response = self.client.get(reverse('posts:home'))
+        self.assertContains(response, post.text)
+        self.assertNotContains(response, 'Changed quietly')
+        post.refresh_from_db()
+        post.save()
         response = self.client.get(reverse('posts:home'))
-        self.assertNotEqual(response.content, posts_text)
+        self.assertContains(response, 'Changed quietly')
+
+    def test_cache_versions_are_scoped(self):
+        """Запись в одну группу не сбрасывает кэш другой"""
+        other_group = Group.objects.create(
+            title='другая группа',
+            slug='OTHER',
+            description='другая группа',
+        )
+        group_version = get_version(f'group:{self.group.pk}')
+        other_version = get_version(f'group:{other_group.pk}')
+        Post.objects.create(
+            text='Пост в группе', author=self.author, group=self.group)
+        self.assertNotEqual(
+            get_version(f'group:{self.group.pk}'), group_version)
+        self.assertEqual(
+            get_version(f'group:{other_group.pk}'), other_version)
+
+    def test_user_save_bumps_only_on_rendered_change(self):
+        """Кэш сбрасывается сменой имени, но не пароля"""
+        cache.clear()
+        Post.objects.create(text='Пост', author=self.author)
+        url = reverse('posts:home')
+        etag = self.client.get(url)['ETag']
+        scopes = ('users', f'author:{self.author.pk}')
+        versions = [get_version(scope) for scope in scopes]
+        user = User.objects.get(pk=self.author.pk)
+        user.set_password('new-password')
+        user.save()
+        self.assertEqual([get_version(scope) for scope in scopes], versions)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        user.first_name = 'Новое'
+        user.last_name = 'Имя'
+        user.save()
+        self.assertNotEqual(get_version('users'), versions[0])
+        self.assertNotEqual(
+            get_version(f'author:{self.author.pk}'), versions[1])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новое Имя')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='тестовая группа',
+            slug='TESTSLUG',
+            description='тестовая группа',
+        )
+        cls.post = Post.objects.create(
+            text='Текст', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_not_modified(self):
+        """Повторный запрос без изменений получает 304"""
+        urls = (
+            reverse('posts:home'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Last-Modified'))
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_page_object_looked_up_once(self):
+        """ETag и страница используют один запрос объекта"""
+        url = reverse('posts:group_posts', kwargs={'slug': self.group.slug})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(
+            len([query for query in queries
+                 if 'FROM "posts_group"' in query['sql']]), 1)
+
+    def test_etag_changes_with_data(self):
+        """ETag меняется после записи, для другого пользователя и страницы"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.reader_client.get(url)['ETag'], etag)
+        self.assertNotEqual(self.client.get(url, {'page': 2})['ETag'], etag)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий'}
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментарий')
+
+    def test_follow_changes_profile_etag(self):
+        """Подписка меняет ETag профиля"""
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+
+    def test_follow_changes_follower_profile_etag(self):
+        """Подписка меняет ETag профиля подписчика: там число подписок"""
+        url = reverse('posts:profile', kwargs={'username': self.reader})
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Подписок: 0')
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Подписок: 1')
+
+    def test_missing_page_has_no_etag(self):
+        """Несуществующие страницы отдают 404 без ETag"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 1000}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
 
 
 class FollowTests(TestCase):
@@ -271,3 +501,279 @@ class FollowTests(TestCase):
         self.assertFalse(Follow.objects.filter(
             user=FollowTests.follower,
             author=FollowTests.following).exists())
+
+    def test_feed_fan_out_on_write(self):
+        """Посты раскладываются по лентам при записи и убираются при отписке"""
+        Post.objects.create(author=self.following, text='Старый пост')
+        Follow.objects.create(user=self.follower, author=self.following)
+        Post.objects.create(author=self.following, text='Новый пост')
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.follower).count(), 2)
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Новый пост', 'Старый пост']
+        )
+        Follow.objects.filter(
+            user=self.follower, author=self.following).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_feed_hybrid_fan_out_on_read(self):
+        """Посты популярных авторов читаются в ленту при запросе"""
+        Follow.objects.create(user=self.follower, author=self.following)
+        Post.objects.create(author=self.following, text='Пост звезды')
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 1)
+        response = self.another_follower_client.get(
+            reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_feed_filled_when_author_stops_being_celebrity(self):
+        """После отписки ниже порога посты звезды попадают в ленты"""
+        Follow.objects.create(user=self.follower, author=self.following)
+        Follow.objects.create(
+            user=self.another_follower, author=self.following)
+        with override_settings(FEED_FANOUT_LIMIT=1):
+            Post.objects.create(author=self.following, text='Пост звезды')
+            self.assertFalse(FeedEntry.objects.exists())
+            Follow.objects.filter(user=self.another_follower).delete()
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост звезды'])
+
+    def test_feed_follows_post_author_change(self):
+        """Смена автора поста перекладывает его по лентам"""
+        Follow.objects.create(user=self.follower, author=self.following)
+        Follow.objects.create(
+            user=self.another_follower, author=self.follower)
+        post = Post.objects.create(author=self.following, text='Пост')
+        post = Post.objects.get(pk=post.pk)
+        post.author = self.follower
+        post.save()
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user_id', 'author_id')),
+            [(self.another_follower.pk, self.follower.pk)])
+
+    def test_created_post_author_change(self):
+        """Смена автора у только что созданного экземпляра поста"""
+        Follow.objects.create(user=self.follower, author=self.following)
+        Follow.objects.create(
+            user=self.another_follower, author=self.follower)
+        post = Post.objects.create(author=self.following, text='Пост')
+        post.author = self.follower
+        post.save()
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user_id', 'author_id')),
+            [(self.another_follower.pk, self.follower.pk)])
+        counts = dict(UserStats.objects.filter(
+            user__in=[self.following, self.follower]
+        ).values_list('user_id', 'posts_count'))
+        self.assertEqual(
+            counts, {self.following.pk: 0, self.follower.pk: 1})
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        """Повторные подписка и отписка не меняют данных и счётчиков"""
+        follow = reverse('posts:profile_follow', args=[self.following])
+        unfollow = reverse('posts:profile_unfollow', args=[self.following])
+        Post.objects.create(author=self.following, text='Пост')
+        for url, expected in ((follow, 1), (follow, 1),
+                              (unfollow, 0), (unfollow, 0)):
+            with self.subTest(url=url):
+                response = self.follower_client.get(url)
+                self.assertRedirects(response, reverse(
+                    'posts:profile', args=[self.following]))
+                self.assertEqual(Follow.objects.filter(
+                    user=self.follower).count(), expected)
+                self.assertEqual(
+                    UserStats.objects.get(
+                        user=self.following).followers_count, expected)
+                self.assertEqual(FeedEntry.objects.filter(
+                    user=self.follower).count(), expected)
+
+    def test_follow_is_single_write(self):
+        """Подписка — одна запись без выборки автора по username"""
+        if not follows.supports_returning():
+            self.skipTest('Без RETURNING автор читается после записи.')
+        url = reverse('posts:profile_follow', args=[self.following])
+        with CaptureQueriesContext(connection) as queries:
+            self.follower_client.get(url)
+        sql = [query['sql'] for query in queries]
+        self.assertEqual(
+            len([query for query in sql if 'INSERT INTO posts_follow' in query
+                 or 'INSERT INTO "posts_follow"' in query]), 1)
+        self.assertFalse([
+            query for query in sql
+            if query.startswith('SELECT') and '"username" =' in query
+        ])
+
+    def test_self_follow_constraint(self):
+        """Подписку на себя не пропускает и база"""
+        self.follower_client.get(
+            reverse('posts:profile_follow', args=[self.follower]))
+        self.assertFalse(Follow.objects.exists())
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.create(
+                    user=self.follower, author=self.follower)
+
+    def test_json_follow_endpoints(self):
+        """JSON-варианты подписки отдают состояние без редиректа"""
+        follow = reverse('posts:api_follow', args=[self.following])
+        unfollow = reverse('posts:api_unfollow', args=[self.following])
+        expected = {'username': 'following', 'following': True,
+                    'followers_count': 1}
+        for _ in range(2):
+            response = self.follower_client.post(follow)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+        response = self.another_follower_client.post(unfollow)
+        self.assertEqual(response.json(), {
+            'username': 'following', 'following': False,
+            'followers_count': 1})
+        response = self.follower_client.post(unfollow)
+        self.assertEqual(response.json(), {
+            'username': 'following', 'following': False,
+            'followers_count': 0})
+        self.assertEqual(self.follower_client.get(follow).status_code, 405)
+        self.assertEqual(self.follower_client.post(reverse(
+            'posts:api_follow', args=[self.follower])).status_code, 400)
+        self.assertEqual(self.follower_client.post(reverse(
+            'posts:api_follow', args=['nobody'])).status_code, 404)
+
+    def test_json_follow_endpoints_anonymous(self):
+        """Аноним получает 401 в JSON, а не редирект на вход"""
+        for name in ('posts:api_follow', 'posts:api_unfollow'):
+            with self.subTest(name=name):
+                response = self.client.post(
+                    reverse(name, args=[self.following]))
+                self.assertEqual(response.status_code, 401)
+                self.assertIn('error', response.json())
+        self.assertFalse(Follow.objects.exists())
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        for number in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, page):
+        return [comment.text for comment in page]
+
+    def test_newest_comments_inline(self):
+        """На странице поста последние комментарии и курсор к старым"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(
+            self.texts(comments),
+            ['Комментарий 4', 'Комментарий 3', 'Комментарий 2'])
+        self.assertIsNotNone(comments.next_cursor)
+        self.assertContains(response, 'Комментариев: 5')
+        self.assertContains(response, comments.next_cursor)
+
+    def test_older_comments_fragment(self):
+        """Фрагмент отдаёт следующую порцию старых комментариев"""
+        first = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': first.context['comments'].next_cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            self.texts(response.context['comments']),
+            ['Комментарий 1', 'Комментарий 0'])
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 1000}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_count_maintained(self):
+        """Счётчики комментариев меняются при добавлении и удалении"""
+        comments = Comment.objects.filter(post=self.post).order_by('-id')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.comment_count, 5)
+        self.assertEqual(post.last_comment_at, comments[0].created)
+        comments[0].delete()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.comment_count, 4)
+        self.assertEqual(post.last_comment_at, comments[0].created)
+        Post.objects.update(comment_count=0, last_comment_at=None)
+        Post.objects.recount_comments()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.comment_count, 4)
+        self.assertEqual(post.last_comment_at, comments[0].created)
+
+    def test_post_delete_skips_comment_counters(self):
+        """Каскадное удаление комментариев не зависит от их числа"""
+        other = Post.objects.create(author=self.user, text='Другой пост')
+        Comment.objects.create(post=other, author=self.user, text='Один')
+        with CaptureQueriesContext(connection) as one:
+            other.delete()
+        post = Post.objects.get(pk=self.post.pk)
+        with CaptureQueriesContext(connection) as five:
+            post.delete()
+        self.assertEqual(len(five), len(one))
+        self.assertFalse([
+            query for query in five
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ])
+        # После удаления отметка снята: комментарии других постов
+        # по-прежнему меняют счётчик.
+        post = Post.objects.create(author=self.user, text='Третий пост')
+        Comment.objects.create(post=post, author=self.user, text='Один')
+        Comment.objects.create(post=post, author=self.user, text='Два')
+        self.assertFalse(deleting_posts())
+        Comment.objects.filter(post=post).first().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def test_post_save_keeps_comment_count(self):
+        """Сохранение поста не затирает счётчик комментариев"""
+        post = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.user, text='Ещё')
+        post.text = 'Исправленный пост'
+        post.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Исправленный пост')
+        self.assertEqual(post.comment_count, 6)
+        self.assertIsNotNone(post.last_comment_at)
+
+    def test_comment_refreshes_listings(self):
+        """Новый комментарий сбрасывает кэш поста и его автора"""
+        urls = (
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Комментариев: 5')
+        Comment.objects.create(post=self.post, author=self.user, text='Ещё')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Комментариев: 6')
+
+    def test_comment_refreshes_index(self):
+        """Счётчик на главной обновляется сразу, а 'posts' не меняется"""
+        url = reverse('posts:home')
+        version = get_version('posts')
+        response = self.client.get(url)
+        self.assertContains(response, 'Комментариев: 5')
+        Comment.objects.create(post=self.post, author=self.user, text='Ещё')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментариев: 6')
+        self.assertEqual(get_version('posts'), version)
@@ -0,0 +1,61 @@
+from contextlib import ContextDecorator, contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class query_budget(ContextDecorator):
+    """
+    Проверяет, что блок кода выполняет не больше budget SQL-запросов.
+
+    Работает как контекстный менеджер и как декоратор:
+
+        with query_budget(4):
+            self.client.get('/')
+
+    Выполненные запросы доступны в атрибуте queries.
+    """
+
+    def __init__(self, budget, using=DEFAULT_DB_ALIAS):
+        self.budget = budget
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        executed = len(self.context)
+        if executed > self.budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(self.context, start=1)
+            )
+            raise AssertionError(
+                f'{executed} queries executed, budget is {self.budget}:\n'
+                f'{queries}'
+            )
+        return False
+
+    @property
+    def queries(self):
+        return self.context.captured_queries
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """
+    Выполняет функции transaction.on_commit, отложенные в блоке: в
+    TestCase транзакция теста не фиксируется и сама их не запустит.
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
@@ -0,0 +1,333 @@
+"""
+Миниатюры изображений постов.
+
+Все размеры, которые используют шаблоны posts, перечислены в VARIANTS.
+Каждый вариант строится в нескольких ширинах (SCALES) и форматах
+(FORMATS: WebP, если его поддерживает Pillow, и JPEG для остальных
+браузеров). После фиксации поста с новым изображением миниатюры
+строятся в пуле процессов (THUMBNAIL_WORKERS, 0 — строить сразу
+в текущем процессе), а затем версии кэша страниц поста увеличиваются.
+Шаблоны только читают готовые миниатюры из kvstore sorl-thumbnail и,
+пока их нет, показывают оригинал; на страницах со списками постов
+наличие миниатюр проверяется одним пакетным запросом (prefetch_pictures).
+"""
+import logging
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.parsers import parse_geometry
+
+from .cache_versions import bump
+
+logger = logging.getLogger(__name__)
+
+Variant = namedtuple('Variant', 'geometry options sizes')
+
+CROP_OPTIONS = {'crop': 'center', 'upscale': True}
+VARIANTS = {
+    # Лента: главная страница и подписки.
+    'feed': Variant(
+        '900x300', CROP_OPTIONS, '(min-width: 992px) 900px, 100vw'),
+    # Страницы группы и профиля.
+    'wide': Variant(
+        '960x400', CROP_OPTIONS, '(min-width: 992px) 960px, 100vw'),
+    # Страница поста.
+    'detail': Variant(
+        '600x239', CROP_OPTIONS, '(min-width: 768px) 600px, 100vw'),
+}
+# Ширины миниатюр относительно ширины варианта (для srcset).
+SCALES = (0.5, 1, 2)
+# Форматы в порядке предпочтения; последний отдаётся в <img>.
+FORMAT_OPTIONS = {
+    'WEBP': {'quality': 75},
+    'JPEG': {'quality': 80, 'progressive': True},
+}
+FORMATS = tuple(
+    format_ for format_ in FORMAT_OPTIONS
+    if format_ != 'WEBP' or features.check('webp')
+)
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def variant_sizes(variant, source_width=None):
+    """Размеры миниатюр варианта; шире исходника — только самая узкая."""
+    width, height = parse_geometry(VARIANTS[variant].geometry)
+    sizes = [
+        (round(width * scale), round(height * scale)) for scale in SCALES
+    ]
+    if source_width:
+        sizes = [size for size in sizes if size[0] <= source_width] or [
+            sizes[0]]
+    return sizes
+
+
+class PrebuiltBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, в котором чтение отделено от генерации."""
+
+    def get_options(self, source, options):
+        """Опции с умолчаниями, как их дополняет get_thumbnail."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_files(self, source, variant, source_width=None):
+        """
+        Миниатюры варианта во всех форматах и ширинах: кортежи
+        (формат, ширина, высота, геометрия, опции, файл).
+        """
+        for format_ in FORMATS:
+            for width, height in variant_sizes(variant, source_width):
+                geometry = f'{width}x{height}'
+                options = self.get_options(source, {
+                    **VARIANTS[variant].options,
+                    **FORMAT_OPTIONS[format_],
+                    'format': format_,
+                })
+                name = self._get_thumbnail_filename(source, geometry, options)
+                thumbnail = ImageFile(name, default.storage)
+                yield format_, width, height, geometry, options, thumbnail
+
+    def candidates(self, image, variant, source_width=None):
+        """Миниатюры варианта, которые могли быть построены."""
+        return [
+            (format_, width, thumbnail)
+            for format_, width, _, _, _, thumbnail in self.thumbnail_files(
+                ImageFile(image), variant, source_width)
+        ]
+
+    def stored_keys(self, thumbnails):
+        """
+        Ключи миниатюр, записанных в kvstore.
+
+        Для cached_db kvstore все ключи читаются из кэша одним get_many,
+        промахи — одним запросом к таблице kvstore, и результат для них
+        (в том числе отсутствие записи) кладётся в кэш одним set_many.
+        """
+        # Модули с моделями sorl нельзя импортировать до django.setup()
+        # в рабочем процессе пула, который импортирует этот модуль.
+        from sorl.thumbnail.kvstores.cached_db_kvstore import (
+            EMPTY_VALUE, KVStore as DBKVStore)
+        from sorl.thumbnail.models import KVStore as KVStoreModel
+
+        thumbnails = list(thumbnails)
+        kvstore = default.kvstore
+        if not isinstance(kvstore, DBKVStore):
+            return {
+                thumbnail.key for thumbnail in thumbnails
+                if kvstore.get(thumbnail) is not None
+            }
+        keys = {
+            add_prefix(thumbnail.key): thumbnail for thumbnail in thumbnails
+        }
+        found = kvstore.cache.get_many(list(keys))
+        missing = [key for key in keys if key not in found]
+        if missing:
+            rows = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            filled = {key: rows.get(key, EMPTY_VALUE) for key in missing}
+            kvstore.cache.set_many(
+                filled, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(filled)
+        return {
+            keys[key].key for key, value in found.items()
+            if value != EMPTY_VALUE
+        }
+
+    def get_prebuilt(self, image, variant, source_width=None, stored=None):
+        """
+        Готовые миниатюры варианта: {формат: [(url, ширина), ...]}.
+
+        Сама ничего не генерирует и не открывает файлы изображений.
+        stored — ключи записанных миниатюр, если они уже прочитаны
+        (см. prefetch_pictures).
+        """
+        candidates = self.candidates(image, variant, source_width)
+        if stored is None:
+            stored = self.stored_keys(
+                thumbnail for _, _, thumbnail in candidates)
+        built = {}
+        for format_, width, thumbnail in candidates:
+            if thumbnail.key in stored:
+                built.setdefault(format_, []).append((thumbnail.url, width))
+        return built
+
+    def render(self, name):
+        """
+        Строит файлы всех миниатюр для изображения name.
+
+        Не обращается ни к БД, ни к kvstore, поэтому подходит для
+        рабочего процесса. Возвращает размеры исходника и пары
+        (имя миниатюры, размеры) для store().
+        """
+        source = ImageFile(name)
+        source_image = default.engine.get_image(source)
+        try:
+            source.set_size(default.engine.get_image_size(source_image))
+            image_info = default.engine.get_image_info(source_image)
+            built = []
+            for variant in VARIANTS:
+                for _, width, height, geometry, options, thumbnail in (
+                        self.thumbnail_files(source, variant, source.width)):
+                    if not thumbnail.exists():
+                        options['image_info'] = image_info
+                        self._create_thumbnail(
+                            source_image, geometry, options, thumbnail)
+                    built.append((thumbnail.name, [width, height]))
+        finally:
+            default.engine.cleanup(source_image)
+        return source.size, built
+
+    def store(self, name, result):
+        """Записывает построенные render() миниатюры в kvstore."""
+        source_size, built = result
+        source = ImageFile(name)
+        source.set_size(source_size)
+        default.kvstore.get_or_set(source)
+        for thumbnail_name, size in built:
+            thumbnail = ImageFile(thumbnail_name, default.storage)
+            thumbnail.set_size(size)
+            default.kvstore.set(thumbnail, source)
+
+
+backend = PrebuiltBackend()
+
+
+def get_picture(image, variant, width=None, height=None, stored=None):
+    """
+    Данные для тега <picture>: источники srcset по форматам, запасной
+    src и размеры. Пока миниатюры не готовы, src — оригинал.
+    """
+    base_width, base_height = parse_geometry(VARIANTS[variant].geometry)
+    built = backend.get_prebuilt(image, variant, width, stored)
+    fallback = built.pop(FORMATS[-1], None)
+    if not fallback:
+        return {
+            'src': image.url,
+            'width': width or base_width,
+            'height': height or base_height,
+            'sources': [],
+        }
+    return {
+        'src': min(fallback, key=lambda item: abs(item[1] - base_width))[0],
+        'srcset': srcset(fallback),
+        'sizes': VARIANTS[variant].sizes,
+        'width': base_width,
+        'height': base_height,
+        'sources': [
+            {'type': MIME_TYPES[format_], 'srcset': srcset(items)}
+            for format_, items in built.items()
+        ],
+    }
+
+
+def srcset(items):
+    return ', '.join(f'{url} {width}w' for url, width in items)
+
+
+def prefetch_pictures(posts, variant):
+    """
+    Готовит данные <picture> для всех постов страницы сразу.
+
+    Вместо отдельного чтения kvstore на каждую миниатюру наличие всех
+    миниатюр страницы проверяется одним пакетным запросом; результат
+    кладётся в post.pictures[variant], откуда его берёт post_picture.
+    """
+    posts = [post for post in posts if post.image]
+    candidates = {
+        post.pk: backend.candidates(post.image, variant, post.image_width)
+        for post in posts
+    }
+    stored = backend.stored_keys(
+        thumbnail for items in candidates.values()
+        for _, _, thumbnail in items
+    )
+    for post in posts:
+        if not hasattr(post, 'pictures'):
+            post.pictures = {}
+        post.pictures[variant] = get_picture(
+            post.image, variant, post.image_width, post.image_height,
+            stored)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker(media_root):
+    django.setup()
+    # Рабочий процесс читает и пишет файлы там же, где создавший его.
+    settings.MEDIA_ROOT = media_root
+
+
+def _render(name):
+    return backend.render(name)
+
+
+def get_executor():
+    """Пул процессов для генерации миниатюр, создаётся при первом вызове."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(settings.MEDIA_ROOT,),
+            )
+        return _executor
+
+
+def shutdown_executor():
+    """Дожидается задач пула и останавливает его."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def _store_result(name, render, scopes):
+    try:
+        backend.store(name, render())
+    except Exception:
+        logger.exception('Не удалось построить миниатюры для %s', name)
+        return
+    # Страницы, отрисованные до готовности миниатюр, показывают оригинал.
+    bump(*scopes)
+
+
+def build(name, scopes=()):
+    """
+    Строит все миниатюры для изображения name (в пуле, если он есть)
+    и затем увеличивает версии областей кэша scopes.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        _store_result(name, lambda: backend.render(name), scopes)
+        return
+    future = get_executor().submit(_render, name)
+    future.add_done_callback(
+        lambda done: _store_result(name, done.result, scopes))
+
+
+def pregenerate(name, scopes=()):
+    """build после фиксации транзакции, в которой сохранён пост."""
+    transaction.on_commit(lambda: build(name, scopes))
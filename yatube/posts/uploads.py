@@ -0,0 +1,130 @@
+"""
+Обработка загруженных картинок постов.
+
+Django пишет файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE во временный файл
+по частям, поэтому загрузка целиком в память не попадает. Здесь по
+заголовку картинки проверяются формат и размеры (UPLOAD_IMAGE_*), а
+слишком большие картинки уменьшаются: для JPEG декодер сразу читает
+уменьшенную копию (draft), для остальных форматов используется reduce.
+Одним перекодированием удаляются EXIF-данные. Пиковый RSS процесса
+пишется в лог.
+"""
+import logging
+import os
+import resource
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+
+def peak_rss():
+    """Пиковый RSS процесса в килобайтах."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def open_image(upload):
+    """Открывает картинку; Pillow при этом читает только заголовок."""
+    if hasattr(upload, 'temporary_file_path'):
+        return Image.open(upload.temporary_file_path())
+    upload.seek(0)
+    return Image.open(upload)
+
+
+def validate_image(image, size):
+    """Проверяет формат, объём файла и число пикселей по заголовку."""
+    if image.format not in settings.UPLOAD_IMAGE_FORMATS:
+        raise ValidationError(
+            'Формат %(format)s не поддерживается.',
+            code='invalid_format',
+            params={'format': image.format},
+        )
+    if size > settings.UPLOAD_IMAGE_MAX_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s МБ.',
+            code='file_too_large',
+            params={'limit': settings.UPLOAD_IMAGE_MAX_SIZE // 2 ** 20},
+        )
+    width, height = image.size
+    if width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def needs_reencode(image):
+    max_side = settings.UPLOAD_IMAGE_MAX_SIDE
+    return 'exif' in image.info or max(image.size) > max_side
+
+
+def reencode(image, name):
+    """
+    Уменьшает картинку до UPLOAD_IMAGE_MAX_SIDE и сохраняет её без EXIF
+    во временный файл; поворот из EXIF применяется к пикселям.
+    """
+    format_ = image.format
+    max_side = settings.UPLOAD_IMAGE_MAX_SIDE
+    # thumbnail() для JPEG вызывает draft(), а для остальных форматов
+    # уменьшает картинку через reduce() до точного ресемплинга.
+    image.thumbnail((max_side, max_side), reducing_gap=2.0)
+    image = ImageOps.exif_transpose(image)
+    # PNG и WebP при сохранении берут EXIF из info, если его не передать.
+    image.info.pop('exif', None)
+    params = {}
+    if 'icc_profile' in image.info:
+        params['icc_profile'] = image.info['icc_profile']
+    if format_ in ('JPEG', 'WEBP'):
+        params['quality'] = settings.UPLOAD_IMAGE_QUALITY
+    # Как и загрузки Django, результат уходит на диск, если он больше
+    # FILE_UPLOAD_MAX_MEMORY_SIZE.
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+    image.save(output, format_, **params)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(output, name, CONTENT_TYPES[format_], size)
+
+
+def process_upload(upload):
+    """
+    Проверяет загруженную картинку и при необходимости перекодирует её.
+
+    Возвращает файл для сохранения в Post.image: исходный или новый
+    временный файл без EXIF. Ошибки проверки — ValidationError.
+    """
+    rss_before = peak_rss()
+    try:
+        image = open_image(upload)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image')
+    with image:
+        validate_image(image, upload.size)
+        animated = getattr(image, 'is_animated', False)
+        if animated or not needs_reencode(image):
+            return upload
+        source_size = image.size
+        result = reencode(image, os.path.basename(upload.name))
+    rss_after = peak_rss()
+    logger.info(
+        'Картинка %s: %s×%s → перекодирована, %s байт; '
+        'пиковый RSS %s КБ (+%s КБ)',
+        upload.name, *source_size, result.size,
+        rss_after, rss_after - rss_before,
+    )
+    return result
@@ -9,8 +9,14 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('search/', views.search, name='search'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -27,4 +33,14 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path(
+        'api/profile/<str:username>/follow/',
+        views.api_follow,
+        name='api_follow'
+    ),
+    path(
+        'api/profile/<str:username>/unfollow/',
+        views.api_unfollow,
+        name='api_unfollow'
+    ),
 ]
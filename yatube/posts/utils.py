@@ -1,9 +1,258 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+KEYSET_KEYS = ('pub_date', 'id')
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключей в непрозрачную строку."""
+    values = [
+        value.isoformat() if hasattr(value, 'isoformat') else value
+        for value in values
+    ]
+    raw = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор, ValueError для испорченных значений."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS):
+        raise ValueError('Invalid cursor')
+    return direction, values
+
+
+class WindowedPaginator(Paginator):
+    """
+    Paginator с ограниченным списком номеров страниц.
+
+    Вместо полного page_range у страницы есть page_window: первые и
+    последние on_ends страниц, on_each_side соседей текущей и ELLIPSIS
+    на месте пропусков. Размер списка не зависит от числа страниц.
+    """
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, on_each_side=None,
+                 on_ends=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if on_each_side is None:
+            on_each_side = settings.PAGINATOR_ON_EACH_SIDE
+        if on_ends is None:
+            on_ends = settings.PAGINATOR_ON_ENDS
+        self.on_each_side = int(on_each_side)
+        self.on_ends = int(on_ends)
+
+    def get_page_window(self, number):
+        """Номера страниц вокруг number с ELLIPSIS на месте пропусков."""
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+        window = []
+        last = 0
+        for start, end in (
+            (1, self.on_ends),
+            (number - self.on_each_side, number + self.on_each_side),
+            (num_pages - self.on_ends + 1, num_pages),
+        ):
+            start = max(start, last + 1, 1)
+            end = min(end, num_pages)
+            if start > end:
+                continue
+            if start == last + 2:
+                window.append(last + 1)
+            elif start > last + 2:
+                window.append(self.ELLIPSIS)
+            window.extend(range(start, end + 1))
+            last = end
+        return window
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.page_window = self.get_page_window(page.number)
+        return page
+
+
+def estimate_rows(model, using='default'):
+    """
+    Оценка числа строк таблицы без COUNT(*): статистика планировщика в
+    PostgreSQL, в остальных базах — наибольший первичный ключ.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    maximum = model._default_manager.using(using).aggregate(
+        maximum=Max('pk'))['maximum']
+    return maximum or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для админки больших таблиц без точного COUNT(*).
+
+    Объекты считаются точно, но не дальше ADMIN_COUNT_LIMIT строк:
+    дальних страниц в выдаче поиска не бывает. Для всей таблицы сначала
+    берётся оценка (estimate_rows), и если она больше лимита, то
+    используется она. Маленькие таблицы считаются точно, поэтому
+    заниженная оценка не приведёт к выборке всей таблицы на одну страницу.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimate_rows(queryset.model, queryset.db)
+            if estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+
+class KeysetPaginator(Paginator):
+    """
+    Постраничный вывод по ключу (по умолчанию pub_date, id) от новых к старым.
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница выбирается условием
+    на ключ последней показанной записи, поэтому время выборки не зависит
+    от глубины. Вместо номеров страниц у Page есть курсоры
+    next_cursor и previous_cursor; has_next() и has_previous() смотрят
+    на них. Номер (page.number) известен только у первой страницы (1),
+    у остальных он None, как и у previous_page_number() и
+    next_page_number(), которые на нём основаны.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, per_page, keys=KEYSET_KEYS):
+        self.keys = tuple(keys)
+        super().__init__(
+            object_list.order_by(*('-' + key for key in self.keys)),
+            per_page,
+        )
+
+    def _to_python(self, values):
+        if len(values) != len(self.keys):
+            raise ValueError('Invalid cursor')
+        opts = self.object_list.model._meta
+        try:
+            values = [
+                opts.get_field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        # null в курсоре не сравнить с ключом: Q(key__lt=None) — ошибка.
+        if any(value is None for value in values):
+            raise ValueError('Invalid cursor')
+        return values
+
+    def _key_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _seek(self, values, lookup):
+        """Условие «ключ строго после values» в лексикографическом порядке."""
+        condition = Q()
+        for position, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[position]})
+            for previous, value in zip(self.keys, values[:position]):
+                step &= Q(**{previous: value})
+            condition |= step
+        # Граница по первому ключу позволяет БД начать чтение индекса
+        # сразу с нужного места, а не просматривать его с начала.
+        bound = Q(**{f'{self.keys[0]}__{lookup}e': values[0]})
+        return bound & condition
+
+    def get_page(self, cursor=None):
+        """Возвращает страницу по курсору; испорченный курсор — первая."""
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+                values = self._to_python(values)
+            except ValueError:
+                pass
+            else:
+                if direction == CURSOR_PREVIOUS:
+                    return self._previous_page(values)
+                return self._next_page(values)
+        return self._build_page(self._fetch(), has_previous=False)
+
+    def _fetch(self, condition=Q(), reverse=False):
+        queryset = self.object_list.filter(condition)
+        if reverse:
+            queryset = queryset.reverse()
+        return list(queryset[:self.per_page + 1])
+
+    def _next_page(self, values):
+        rows = self._fetch(self._seek(values, 'lt'))
+        page = self._build_page(rows, has_previous=True)
+        if not page.object_list:
+            page.previous_cursor = encode_cursor(CURSOR_PREVIOUS, values)
+        return page
+
+    def _previous_page(self, values):
+        rows = self._fetch(self._seek(values, 'gt'), reverse=True)
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаём обычную первую страницу.
+            return self._build_page(self._fetch(), has_previous=False)
+        rows = rows[:self.per_page][::-1]
+        page = self._make_page(rows, None)
+        page.next_cursor = encode_cursor(
+            CURSOR_NEXT, self._key_values(rows[-1]))
+        page.previous_cursor = encode_cursor(
+            CURSOR_PREVIOUS, self._key_values(rows[0]))
+        return page
+
+    def _make_page(self, rows, number):
+        page = self._get_page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        # Соседние страницы определяются курсорами, а не num_pages,
+        # чтобы не считать строки.
+        page.has_next = lambda: page.next_cursor is not None
+        page.has_previous = lambda: page.previous_cursor is not None
+        return page
+
+    def _build_page(self, rows, has_previous):
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        page = self._make_page(rows, None if has_previous else 1)
+        if has_next:
+            page.next_cursor = encode_cursor(
+                CURSOR_NEXT, self._key_values(rows[-1]))
+        if has_previous and rows:
+            page.previous_cursor = encode_cursor(
+                CURSOR_PREVIOUS, self._key_values(rows[0]))
+        return page
+
 
+def get_paginator(request, inform, keys=KEYSET_KEYS):
+    """
+    Курсорная пагинация по умолчанию (?cursor=...).
 
-def get_paginator(request, inform):
-    paginator = Paginator(inform, settings.PAGES)
+    Параметр ?page=N оставлен для совместимости и обслуживается
+    WindowedPaginator с ограниченным списком номеров страниц.
+    """
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        paginator = WindowedPaginator(inform, settings.PAGES)
+        return paginator.get_page(page_number)
+    paginator = KeysetPaginator(inform, settings.PAGES, keys)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -1,62 +1,177 @@
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_POST
 
 from posts.forms import PostForm, CommentForm
-from .models import Follow, Post, Group, Comment, User
-from posts.utils import get_paginator
+from .models import Comment, Post, Group, User, UserStats
+from posts import follow_graph, follows
+from posts.cache_versions import conditional_page, fragment_context
+from posts.feed import get_feed_page
+from posts.search import search_posts
+from posts.utils import KeysetPaginator, WindowedPaginator, get_paginator
+
+
+COMMENT_KEYS = ('created', 'id')
+
+
+def page_object(request, queryset, **lookup):
+    """
+    Объект страницы или 404. Ищется один раз: сначала для ETag в
+    conditional_page, затем самой страницей.
+    """
+    if not hasattr(request, '_page_object'):
+        request._page_object = get_object_or_404(queryset, **lookup)
+    return request._page_object
+
+
+def get_group(request, slug):
+    return page_object(request, Group.objects.all(), slug=slug)
+
+
+def get_author(request, username):
+    return page_object(
+        request, User.objects.select_related('stats'), username=username)
+
+
+def get_post(request, post_id):
+    return page_object(
+        request, Post.objects.select_related('author__stats', 'group'),
+        pk=post_id)
+
 
+def index_scopes(request):
+    return ('posts', 'comments', 'users')
 
+
+def group_scopes(request, slug):
+    return (f'group:{get_group(request, slug).pk}', 'users')
+
+
+def profile_scopes(request, username):
+    author_id = get_author(request, username).pk
+    return (f'author:{author_id}', f'followers:{author_id}',
+            f'following:{author_id}', 'groups')
+
+
+def post_scopes(request, post_id):
+    author_id = get_post(request, post_id).author_id
+    return (f'post:{post_id}', f'author:{author_id}', 'users', 'groups')
+
+
+@conditional_page(index_scopes)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author', 'group')
     page_obj = get_paginator(request, posts)
     context = {
         'page_obj': page_obj,
+        **fragment_context('posts', 'comments', 'users'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_scopes)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    group = get_group(request, slug)
+    posts = group.posts.select_related('author', 'group')
     page_obj = get_paginator(request, posts)
     context = {
         'group': group,
         'page_obj': page_obj,
+        **fragment_context(f'group:{group.pk}', 'users'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author__username=username)
+    author = get_author(request, username)
+    posts = author.posts.select_related('author', 'group')
     page_obj = get_paginator(request, posts)
-    count = posts.count()
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author).exists()
+    stats = UserStats.objects.for_user(author)
+    following = follow_graph.is_following(
+        request.user, [author.pk])[author.pk]
     context = {
         'author': author,
         'page_obj': page_obj,
-        'count': count,
-        'following': following
+        'count': stats.posts_count,
+        'stats': stats,
+        'following': following,
+        **fragment_context(f'author:{author.pk}', 'groups'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    posts_selection = Post.objects.filter(author_id=post.author)
-    count = posts_selection.count()
+    post = get_post(request, post_id)
+    count = UserStats.objects.for_user(post.author).posts_count
     form = CommentForm()
-    comments = Comment.objects.filter(post=post).all()
+    comments = get_comments_page(post.pk)
     context = {
         'post': post,
         'count': count,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        **fragment_context(
+            f'post:{post.pk}', f'author:{post.author_id}', 'users', 'groups'),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_scopes(request, post_id):
+    return (f'post:{post_id}', 'users')
+
+
+def get_comments_page(post_id, cursor=None):
+    """Страница комментариев поста от новых к старым."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author')
+    paginator = KeysetPaginator(
+        comments, settings.COMMENTS_PER_PAGE, keys=COMMENT_KEYS)
+    return paginator.get_page(cursor)
+
+
+@conditional_page(comment_scopes)
+def post_comments(request, post_id):
+    """Фрагмент с более старыми комментариями для подгрузки."""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(post_id, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    author = request.GET.get('author', '').strip()
+    group = request.GET.get('group', '').strip()
+    author_id = group_id = None
+    if author:
+        author_id = get_object_or_404(User, username=author).pk
+    if group:
+        group_id = get_object_or_404(Group, slug=group).pk
+    results = search_posts(query, author_id, group_id)
+    paginator = WindowedPaginator(results, settings.PAGES)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    params = {'q': query, 'author': author, 'group': group}
+    page_query = urlencode({key: value for key, value in params.items()
+                            if value})
+    context = {
+        'page_obj': page_obj,
+        'page_query': page_query + '&' if page_query else '',
+        'query': query,
+        'author': author,
+        'group': group,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -111,9 +226,7 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     follower = request.user
-    post_list = Post.objects.filter(
-        author__following__user=follower)
-    page_obj = get_paginator(request, post_list)
+    page_obj = get_feed_page(request, follower)
     context = {
         'page_obj': page_obj,
         'follower': follower,
@@ -124,18 +237,57 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    follower = request.user
-    author = get_object_or_404(User, username=username)
-    if follower != author:
-        Follow.objects.get_or_create(
-            user=follower, author=author
-        )
+    follows.follow(request.user.pk, username)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follow = get_object_or_404(Follow, user=request.user, author=author)
-    follow.delete()
+    follows.unfollow(request.user.pk, username)
     return redirect('posts:profile', username)
+
+
+def json_login_required(view):
+    """Как login_required, но анониму отвечает JSON с кодом 401."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'error': 'Требуется авторизация.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def follow_state(request, username, author_id, following):
+    """
+    Ответ JSON-вариантов подписки. Если запись ничего не изменила,
+    автор читается отдельно, чтобы отличить отсутствующего автора.
+    """
+    if author_id is None:
+        author_id = User.objects.filter(username=username).values_list(
+            'pk', flat=True).first()
+        if author_id is None:
+            return JsonResponse({'error': 'Автор не найден.'}, status=404)
+        if following and author_id == request.user.pk:
+            return JsonResponse(
+                {'error': 'Нельзя подписаться на себя.'}, status=400)
+    return JsonResponse({
+        'username': username,
+        'following': following,
+        'followers_count': follow_graph.followers_count(
+            [author_id])[author_id],
+    })
+
+
+@json_login_required
+@require_POST
+def api_follow(request, username):
+    author_id = follows.follow(request.user.pk, username)
+    return follow_state(request, username, author_id, True)
+
+
+@json_login_required
+@require_POST
+def api_unfollow(request, username):
+    author_id = follows.unfollow(request.user.pk, username)
+    return follow_state(request, username, author_id, False)
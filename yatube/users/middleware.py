@@ -0,0 +1,71 @@
+"""
+Пользователь запроса из кэша.
+
+AuthenticationMiddleware Django на каждый запрос читает пользователя из
+базы. CachedAuthenticationMiddleware делает то же, что
+django.contrib.auth.get_user, но берёт пользователя из кэша по ключу
+USER_CACHE_KEY; вместе с сессиями cached_db запрос авторизованного
+пользователя не обращается к базе. Запись в кэше удаляется при
+сохранении и удалении пользователя и при выходе (users.signals), а смена
+пароля, как и в Django, делает сессию недействительной через хэш.
+"""
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 _get_user_session_key, load_backend)
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+USER_CACHE_KEY = 'users:user:{}'
+
+
+def forget_user(user_id):
+    """Удаляет пользователя из кэша."""
+    cache.delete(USER_CACHE_KEY.format(user_id))
+
+
+def load_user(backend, user_id):
+    key = USER_CACHE_KEY.format(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = backend.get_user(user_id)
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def get_user(request):
+    """Как django.contrib.auth.get_user, но пользователь берётся из кэша."""
+    user = None
+    try:
+        user_id = _get_user_session_key(request)
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        pass
+    else:
+        if backend_path in settings.AUTHENTICATION_BACKENDS:
+            user = load_user(load_backend(backend_path), user_id)
+            if hasattr(user, 'get_session_auth_hash'):
+                session_hash = request.session.get(HASH_SESSION_KEY)
+                verified = session_hash and constant_time_compare(
+                    session_hash, user.get_session_auth_hash())
+                if not verified:
+                    request.session.flush()
+                    user = None
+    return user or AnonymousUser()
+
+
+def cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware с пользователем из кэша."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: cached_user(request))
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..middleware import USER_CACHE_KEY
+
+User = get_user_model()
+
+
+class CachedAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', password='old-password-1')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.key = USER_CACHE_KEY.format(self.user.pk)
+
+    def identity_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        tables = ('django_session', 'auth_user"')
+        return response, [
+            query['sql'] for query in queries
+            if any(f'FROM "{table}' in query['sql'] for table in tables)
+        ]
+
+    def test_hot_page_has_no_identity_queries(self):
+        url = reverse('posts:follow_index')
+        response, queries = self.identity_queries(url)
+        self.assertEqual(response.context['user'], self.user)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.identity_queries(url)
+        self.assertEqual(response.context['user'], self.user)
+        self.assertEqual(queries, [])
+
+    def test_user_update_invalidates(self):
+        self.client.get(reverse('posts:home'))
+        self.assertIsNotNone(cache.get(self.key))
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        self.assertIsNone(cache.get(self.key))
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['user'].first_name, 'Новое имя')
+
+    def test_password_change_logs_out(self):
+        self.client.get(reverse('posts:follow_index'))
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new-password-2')
+        user.save()
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_invalidates(self):
+        self.client.get(reverse('posts:follow_index'))
+        self.assertIsNotNone(cache.get(self.key))
+        self.client.get(reverse('users:logout'))
+        self.assertIsNone(cache.get(self.key))
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 302)
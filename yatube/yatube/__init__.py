@@ -0,0 +1,11 @@
+import os
+
+SETTINGS_MODULES = {
+    'development': 'yatube.settings',
+    'production': 'yatube.settings_production',
+}
+
+
+def settings_module():
+    """Модуль настроек по переменной окружения YATUBE_ENV."""
+    return SETTINGS_MODULES[os.environ.get('YATUBE_ENV', 'development')]
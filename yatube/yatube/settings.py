@@ -52,11 +52,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -102,6 +103,16 @@ DATABASES = {
     }
 }
 
+# PRAGMA, которые core.sqlite выполняет для каждого нового соединения;
+# боевые значения — в yatube.settings_production.
+SQLITE_PRAGMAS = {}
+
+
+# Сессии читаются из кэша и пишутся ещё и в базу, а пользователь
+# запроса берётся из кэша (users.middleware) на USER_CACHE_TIMEOUT секунд.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,11 +160,68 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGES = 10
 
+# Сколько комментариев показывать на странице поста и подгружать за раз.
+COMMENTS_PER_PAGE = 20
+
+# Дальше этого числа строк админка не считает отфильтрованные списки
+# (posts.utils.EstimatedCountPaginator).
+ADMIN_COUNT_LIMIT = 10000
+
+# Поиск (posts.search) считает и листает не больше стольких лучших
+# результатов: глубина OFFSET и COUNT(*) не растут с числом совпадений.
+SEARCH_MAX_RESULTS = 1000
+
+# Сколько номеров страниц показывать вокруг текущей и по краям.
+PAGINATOR_ON_EACH_SIDE = 2
+PAGINATOR_ON_ENDS = 1
+
+# Посты авторов, у которых подписчиков больше этого числа, не раскладываются
+# по лентам при записи, а читаются при запросе ленты; None — раскладывать все.
+FEED_FANOUT_LIMIT = 10000
+# Сколько последних постов автора добавляется в ленту при подписке.
+FEED_BACKFILL = 200
+
+# Импорт (posts.transfer) запоминает затронутых пользователей и посты,
+# чтобы пересчитать только их. Если их больше этого числа, он перестаёт
+# их помнить и пересчитывает всё: память не растёт с размером выгрузки.
+IMPORT_TRACK_LIMIT = 100_000
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки больше этого объёма пишутся во временный файл по частям.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+# Ограничения для картинок постов (posts.uploads): проверяются по
+# заголовку файла до декодирования.
+UPLOAD_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+UPLOAD_IMAGE_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_IMAGE_MAX_PIXELS = 50_000_000
+# Картинки с большей стороной длиннее этой уменьшаются при загрузке.
+UPLOAD_IMAGE_MAX_SIDE = 2560
+UPLOAD_IMAGE_QUALITY = 90
+
+# Сколько процессов строят миниатюры заранее (posts.thumbnails);
+# 0 — строить их в том же процессе сразу после сохранения поста.
+THUMBNAIL_WORKERS = 2
+
+# Фрагменты шаблонов сбрасываются сигналами через версии ключей
+# (posts.cache_versions), поэтому их можно хранить долго.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Справочники для полей форм (posts.lookups) тоже сбрасываются версиями.
+LOOKUP_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Подписки и счётчики подписчиков в кэше (posts.follow_graph) удаляются
+# сигналами Follow при каждом изменении.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
+
+# Доля запросов, для которых core.middleware замеряет SQL, шаблоны и кэш
+# и отдаёт заголовок Server-Timing. По умолчанию замеры выключены;
+# включаются явно, например INSTRUMENTATION_SAMPLE_RATE = 1.0 при отладке.
+INSTRUMENTATION_SAMPLE_RATE = 0
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -0,0 +1,83 @@
+"""
+Настройки для боевого сервера.
+
+Выбираются переменной окружения YATUBE_ENV=production (см. manage.py и
+wsgi.py). Отличия от yatube.settings: без отладки и debug_toolbar,
+шаблоны компилируются один раз (cached.Loader), соединения с базой
+живут между запросами, а SQLite работает в режиме WAL.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, INSTALLED_APPS, MIDDLEWARE, TEMPLATES
+
+DEBUG = False
+
+# Ключ из yatube.settings лежит в репозитории: без своего ключа
+# боевой сервер не запускается.
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Не задана переменная DJANGO_SECRET_KEY.')
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'debug_toolbar']
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if not middleware.startswith('debug_toolbar.')
+]
+
+INTERNAL_IPS = []
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    # С явным списком loaders APP_DIRS должен быть выключен.
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
+
+# Соединение с базой держится между запросами столько секунд.
+CONN_MAX_AGE = 600
+
+# PRAGMA для каждого нового соединения с SQLite (core.sqlite).
+# WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL
+# не теряет целостность при сбое процесса, busy_timeout ждёт блокировку
+# вместо ошибки database is locked, mmap_size читает файл базы через
+# отображение в память, cache_size < 0 задаёт кэш страниц в КБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+THUMBNAIL_WORKERS = 2
+
+INSTRUMENTATION_SAMPLE_RATE = 0.01
+
+# Один кэш на все процессы сервера (core.cache): фрагменты, версии
+# ключей и записи sorl-thumbnail общие для воркеров.
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    }
+}